@@ -1,21 +1,40 @@
-import json
 from typing import Dict, Any
 
+from utils.payload_serializer import PayloadSerializer
+
 class ClinicalDocumentationAgent:
     """
     Clinical Documentation Agent
     Uses MedGemma (text-only) locally.
     """
 
+    GENERATION_KWARGS = {
+        "max_new_tokens": 400,
+        "do_sample": True,
+        "temperature": 0.3
+    }
+
     def __init__(
         self,
         model,
-        processor
+        processor,
+        engine=None,
+        compact_payloads: bool = True
     ):
+        """
+        Args:
+            model: locally loaded MedGemma model
+            processor: matching processor
+            engine: optional AsyncInferenceEngine used by `arun`
+            compact_payloads: serialize upstream results with the compact
+                encoding instead of verbose JSON
+        """
         self.model = model
         self.processor = processor
+        self.engine = engine
+        self.serializer = PayloadSerializer(compact=compact_payloads)
 
-    def run(
+    def build_prompt(
         self,
         patient_context: Dict[str, Any],
         intake_results: Dict[str, Any],
@@ -23,10 +42,9 @@ class ClinicalDocumentationAgent:
         triage_results: Dict[str, Any]
     ) -> str:
         """
-        Generate clinical documentation text
+        Build the documentation prompt
         """
-
-        prompt = (
+        return (
             "You are a Clinical Documentation Agent.\n"
             "Generate structured ophthalmic screening notes.\n\n"
             "Output format:\n"
@@ -36,10 +54,27 @@ class ClinicalDocumentationAgent:
             "- Screening Observations:\n"
             "- Triage Recommendation:\n\n"
             "Provide the content for these sections based on the inputs below:\n"
-            f"Patient context: {json.dumps(patient_context)}\n"
-            f"Intake & image quality: {json.dumps(intake_results)}\n"
-            f"Screening findings: {json.dumps(screening_results)}\n"
-            f"Triage decision: {json.dumps(triage_results)}"
+            + self.serializer.render([
+                ("Patient context", patient_context),
+                ("Intake & image quality", intake_results),
+                ("Screening findings", screening_results),
+                ("Triage decision", triage_results)
+            ])
+        )
+
+    def run(
+        self,
+        patient_context: Dict[str, Any],
+        intake_results: Dict[str, Any],
+        screening_results: Dict[str, Any],
+        triage_results: Dict[str, Any]
+    ) -> str:
+        """
+        Generate clinical documentation text
+        """
+
+        prompt = self.build_prompt(
+            patient_context, intake_results, screening_results, triage_results
         )
         
         try:
@@ -47,22 +82,58 @@ class ClinicalDocumentationAgent:
             inputs = self.processor(text=prompt, return_tensors="pt").to(self.model.device)
             generate_ids = self.model.generate(
                 **inputs,
-                max_new_tokens=400,
-                do_sample=True,
-                temperature=0.3
+                **self.GENERATION_KWARGS
             )
-            documentation = self.processor.batch_decode(generate_ids, skip_special_tokens=True)[0]
+            # Decode only the completion; the echoed prompt holds the output template
+            new_tokens = generate_ids[:, inputs["input_ids"].shape[1]:]
+            documentation = self.processor.batch_decode(new_tokens, skip_special_tokens=True)[0]
 
         except Exception as e:
             print(f"Local inference failed: {e}")
-            return (
-                "Screening Summary (System Generated Fallback):\n"
-                "- Patient Summary: Context available in patient data.\n"
-                "- Image Quality: " + str(intake_results.get('image_quality', 'Unknown')) + "\n"
-                "- Screening Observations: Automated screening failed due to local inference error.\n"
-                "- Triage Recommendation: HIGH RISK (Safety Fallback) - Please review manually."
+            return self._fallback(intake_results)
+
+        return self._clean_output(documentation)
+
+    async def arun(
+        self,
+        patient_context: Dict[str, Any],
+        intake_results: Dict[str, Any],
+        screening_results: Dict[str, Any],
+        triage_results: Dict[str, Any]
+    ) -> str:
+        """
+        Generate clinical documentation text through the shared inference engine
+        """
+        if self.engine is None:
+            raise RuntimeError("ClinicalDocumentationAgent.arun requires an inference engine")
+
+        prompt = self.build_prompt(
+            patient_context, intake_results, screening_results, triage_results
+        )
+
+        try:
+            print("Submitting Documentation Agent request to inference engine...")
+            documentation = await self.engine.generate(
+                prompt,
+                params=self.GENERATION_KWARGS
             )
-        
+
+        except Exception as e:
+            print(f"Local inference failed: {e}")
+            return self._fallback(intake_results)
+
+        return self._clean_output(documentation)
+
+    def _fallback(self, intake_results: Dict[str, Any]) -> str:
+        return (
+            "Screening Summary (System Generated Fallback):\n"
+            "- Patient Summary: Context available in patient data.\n"
+            "- Image Quality: " + str(intake_results.get('image_quality', 'Unknown')) + "\n"
+            "- Screening Observations: Automated screening failed due to local inference error.\n"
+            "- Triage Recommendation: HIGH RISK (Safety Fallback) - Please review manually."
+        )
+
+    def _clean_output(self, documentation: str) -> str:
         # Clean up output
         if "Screening Summary:" in documentation:
              parts = documentation.split("Screening Summary:")
@@ -1,61 +1,126 @@
-import json
 from typing import Dict, Any
 
+from utils.payload_serializer import PayloadSerializer
+
 class PatientCommunicationAgent:
     """
     Patient Communication Agent
     Uses MedGemma (text-only) locally.
     """
 
+    GENERATION_KWARGS = {
+        "max_new_tokens": 300,
+        "do_sample": True,
+        "temperature": 0.3
+    }
+
     def __init__(
         self,
         model,
-        processor
+        processor,
+        engine=None,
+        compact_payloads: bool = True
     ):
+        """
+        Args:
+            model: locally loaded MedGemma model
+            processor: matching processor
+            engine: optional AsyncInferenceEngine used by `arun`
+            compact_payloads: serialize upstream results with the compact
+                encoding instead of verbose JSON
+        """
         self.model = model
         self.processor = processor
+        self.engine = engine
+        self.serializer = PayloadSerializer(compact=compact_payloads)
 
-    def run(
+    def build_prompt(
         self,
         patient_context: Dict[str, Any],
         screening_results: Dict[str, Any],
         triage_results: Dict[str, Any]
     ) -> str:
         """
-        Generate patient-facing explanation
+        Build the patient communication prompt
         """
-
-        prompt = (
+        return (
             "You are a Patient Communication Agent.\n"
             "Explain the results to the patient in simple, reassuring language.\n\n"
             "Output format:\n"
             "Patient Explanation:\n"
             "... (2-3 paragraphs)\n\n"
-            f"Patient context: {json.dumps(patient_context)}\n"
-            f"Screening findings: {json.dumps(screening_results)}\n"
-            f"Triage recommendation: {json.dumps(triage_results)}"
+            + self.serializer.render([
+                ("Patient context", patient_context),
+                ("Screening findings", screening_results),
+                ("Triage recommendation", triage_results)
+            ])
         )
+
+    def run(
+        self,
+        patient_context: Dict[str, Any],
+        screening_results: Dict[str, Any],
+        triage_results: Dict[str, Any]
+    ) -> str:
+        """
+        Generate patient-facing explanation
+        """
+
+        prompt = self.build_prompt(patient_context, screening_results, triage_results)
         
         try:
              print("Running local inference for Patient Communication Agent...")
              inputs = self.processor(text=prompt, return_tensors="pt").to(self.model.device)
              generate_ids = self.model.generate(
                 **inputs,
-                max_new_tokens=300,
-                do_sample=True,
-                temperature=0.3
+                **self.GENERATION_KWARGS
              )
-             explanation = self.processor.batch_decode(generate_ids, skip_special_tokens=True)[0]
+             # Decode only the completion; the echoed prompt holds the output template
+             new_tokens = generate_ids[:, inputs["input_ids"].shape[1]:]
+             explanation = self.processor.batch_decode(new_tokens, skip_special_tokens=True)[0]
 
         except Exception as e:
             print(f"Local inference failed: {e}")
-            return (
-                "Patient Explanation:\n"
-                "We are currently experiencing technical difficulties with our automated analysis system. "
-                "However, your images have been safely captured. "
-                "Please consult with your healthcare provider for a manual review of your screening results."
+            return self._fallback()
+
+        return self._clean_output(explanation)
+
+    async def arun(
+        self,
+        patient_context: Dict[str, Any],
+        screening_results: Dict[str, Any],
+        triage_results: Dict[str, Any]
+    ) -> str:
+        """
+        Generate patient-facing explanation through the shared inference engine
+        """
+        if self.engine is None:
+            raise RuntimeError("PatientCommunicationAgent.arun requires an inference engine")
+
+        prompt = self.build_prompt(patient_context, screening_results, triage_results)
+
+        try:
+            print("Submitting Patient Communication Agent request to inference engine...")
+            explanation = await self.engine.generate(
+                prompt,
+                params=self.GENERATION_KWARGS
             )
 
+        except Exception as e:
+            print(f"Local inference failed: {e}")
+            return self._fallback()
+
+        return self._clean_output(explanation)
+
+    def _fallback(self) -> str:
+        return (
+            "Patient Explanation:\n"
+            "We are currently experiencing technical difficulties with our automated analysis system. "
+            "However, your images have been safely captured. "
+            "Please consult with your healthcare provider for a manual review of your screening results."
+        )
+
+    def _clean_output(self, explanation: str) -> str:
         if "Patient Explanation:" in explanation:
              parts = explanation.split("Patient Explanation:")
              if len(parts) > 1:
@@ -0,0 +1,165 @@
+import threading
+from typing import Dict, Any
+
+from agents.documentation_agent import ClinicalDocumentationAgent
+from agents.patient_communication_agent import PatientCommunicationAgent
+from utils.report_templates import (
+    is_routine,
+    render_clinical_note,
+    render_patient_explanation
+)
+
+class ReportingAgent:
+    """
+    Reporting Agent
+    Produces the clinical note and patient explanation for one patient,
+    choosing between deterministic templates and the LLM agents.
+
+    Modes:
+    - "llm": always call the Documentation and Communication agents
+    - "auto": templates for routine outcomes, LLM only when there are findings
+    - "template": never call the LLM (fully deterministic export)
+    """
+
+    MODES = ("llm", "auto", "template")
+
+    # Documentation + patient communication
+    LLM_CALLS_PER_REPORT = 2
+
+    def __init__(
+        self,
+        model,
+        processor,
+        mode: str = "auto",
+        engine=None,
+        compact_payloads: bool = True
+    ):
+        """
+        Args:
+            model: locally loaded MedGemma model
+            processor: matching processor
+            mode: one of MODES
+            engine: optional AsyncInferenceEngine used by `arun`
+            compact_payloads: passed through to the LLM agents
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown reporting mode '{mode}'. Choose from: {', '.join(self.MODES)}")
+
+        self.mode = mode
+        self.documentation_agent = ClinicalDocumentationAgent(
+            model, processor, engine=engine, compact_payloads=compact_payloads
+        )
+        self.patient_agent = PatientCommunicationAgent(
+            model, processor, engine=engine, compact_payloads=compact_payloads
+        )
+
+        self.reports = 0
+        self.llm_calls = 0
+        self.llm_calls_avoided = 0
+        self._lock = threading.Lock()
+
+    def uses_template(
+        self,
+        intake_results: Dict[str, Any],
+        screening_results: Dict[str, Any],
+        triage_results: Dict[str, Any]
+    ) -> bool:
+        """
+        Whether this case is rendered from templates in the current mode
+        """
+        if self.mode == "template":
+            return True
+        if self.mode == "llm":
+            return False
+        return is_routine(intake_results, screening_results, triage_results)
+
+    def run(
+        self,
+        patient_context: Dict[str, Any],
+        intake_results: Dict[str, Any],
+        screening_results: Dict[str, Any],
+        triage_results: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """
+        Produce clinical note and patient explanation
+
+        Returns:
+            {"clinical_documentation", "patient_communication", "report_source"}
+        """
+        if self.uses_template(intake_results, screening_results, triage_results):
+            return self._render(patient_context, intake_results, screening_results, triage_results)
+
+        clinical_note = self.documentation_agent.run(
+            patient_context=patient_context,
+            intake_results=intake_results,
+            screening_results=screening_results,
+            triage_results=triage_results
+        )
+        patient_message = self.patient_agent.run(
+            patient_context=patient_context,
+            screening_results=screening_results,
+            triage_results=triage_results
+        )
+        return self._record_llm(clinical_note, patient_message)
+
+    async def arun(
+        self,
+        patient_context: Dict[str, Any],
+        intake_results: Dict[str, Any],
+        screening_results: Dict[str, Any],
+        triage_results: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """
+        Produce clinical note and patient explanation through the shared inference engine
+        """
+        if self.uses_template(intake_results, screening_results, triage_results):
+            return self._render(patient_context, intake_results, screening_results, triage_results)
+
+        clinical_note = await self.documentation_agent.arun(
+            patient_context, intake_results, screening_results, triage_results
+        )
+        patient_message = await self.patient_agent.arun(
+            patient_context, screening_results, triage_results
+        )
+        return self._record_llm(clinical_note, patient_message)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        LLM calls made and avoided so far
+        """
+        with self._lock:
+            total = self.llm_calls + self.llm_calls_avoided
+            return {
+                "mode": self.mode,
+                "reports": self.reports,
+                "llm_calls": self.llm_calls,
+                "llm_calls_avoided": self.llm_calls_avoided,
+                "fraction_avoided": round(self.llm_calls_avoided / total, 3) if total else 0.0
+            }
+
+    def _render(self, patient_context, intake_results, screening_results, triage_results):
+        with self._lock:
+            self.reports += 1
+            self.llm_calls_avoided += self.LLM_CALLS_PER_REPORT
+        return {
+            "clinical_documentation": render_clinical_note(
+                patient_context, intake_results, screening_results, triage_results
+            ),
+            "patient_communication": render_patient_explanation(
+                patient_context, screening_results, triage_results
+            ),
+            "report_source": "template"
+        }
+
+    def _record_llm(self, clinical_note: str, patient_message: str) -> Dict[str, Any]:
+        with self._lock:
+            self.reports += 1
+            self.llm_calls += self.LLM_CALLS_PER_REPORT
+        return {
+            "clinical_documentation": clinical_note,
+            "patient_communication": patient_message,
+            "report_source": "llm"
+        }
+
+if __name__ == "__main__":
+    pass
@@ -1,7 +1,10 @@
 import json
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
+import torch
 from PIL import Image
 
+from models.admission_control import AdmissionController, is_oom_error
+
 class OphthalmicScreeningAgent:
     """
     Ophthalmic Screening Agent
@@ -9,27 +12,40 @@ class OphthalmicScreeningAgent:
     Performs screening-level visual feature description ONLY
     """
 
+    GENERATION_KWARGS = {
+        "max_new_tokens": 512,
+        "do_sample": True,
+        "temperature": 0.2
+    }
+
     def __init__(
         self,
         model,
-        processor
+        processor,
+        engine=None,
+        admission: AdmissionController = None
     ):
+        """
+        Args:
+            model: locally loaded MedGemma model
+            processor: matching processor
+            engine: optional AsyncInferenceEngine used by `arun`
+            admission: memory-aware admission policy, shared between agents
+                running concurrently (created on first use when omitted)
+        """
         self.model = model
         self.processor = processor
+        self.engine = engine
+        self.admission = admission
 
-    def run(
+    def build_prompt(
         self,
-        patient_context: Dict[str, Any],
-        image_path: str
-    ) -> Dict[str, Any]:
+        patient_context: Dict[str, Any]
+    ) -> str:
         """
-        Run screening agent on fundus image
-        
-        Returns:
-            dict following screening agent JSON schema
+        Build the screening prompt
         """
-
-        prompt = (
+        return (
             "You are an Ophthalmic Screening Agent.\n"
             "Analyze the retinal fundus image and return a JSON object with observations.\n\n"
             "Rules:\n"
@@ -45,28 +61,50 @@ class OphthalmicScreeningAgent:
             f"Patient context: {json.dumps(patient_context)}"
         )
 
+    def prepare_inputs(
+        self,
+        patient_context: Dict[str, Any],
+        image_path: str
+    ):
+        """
+        Load the image and build processor inputs on the CPU.
+
+        Split out of `run` so a pipeline can preprocess the next patient
+        while the model is still decoding the current one.
+        """
+        prompt = self.build_prompt(patient_context)
+        raw_image = Image.open(image_path).convert("RGB")
+
+        # Note: MedGemma/PaliGemma typically handles prompts like "detect: " or just natural language.
+        # We assume the model expects the text prompt first.
+        return self.processor(text=prompt, images=raw_image, return_tensors="pt")
+
+    def run(
+        self,
+        patient_context: Dict[str, Any],
+        image_path: str,
+        inputs=None
+    ) -> Dict[str, Any]:
+        """
+        Run screening agent on fundus image
+
+        Args:
+            inputs: optional result of `prepare_inputs` computed ahead of time
+        
+        Returns:
+            dict following screening agent JSON schema
+        """
+
         try:
             print("Running local inference for Screening Agent...")
-            raw_image = Image.open(image_path).convert("RGB")
-            
             # Prepare inputs
-            # Note: MedGemma/PaliGemma typically handles prompts like "detect: " or just natural language.
-            # We assume the model expects the text prompt first.
-            inputs = self.processor(text=prompt, images=raw_image, return_tensors="pt").to(self.model.device)
+            if inputs is None:
+                inputs = self.prepare_inputs(patient_context, image_path)
             
             # Generate
-            # Using standard generation parameters
-            generate_ids = self.model.generate(
-                **inputs, 
-                max_new_tokens=512,
-                do_sample=True,
-                temperature=0.2 
-            )
-            
-            # Decode
-            # The model output usually contains the input prompt as well, we might need to strip it
-            # or skip special tokens.
-            output_text = self.processor.batch_decode(generate_ids, skip_special_tokens=True)[0]
+            # Using standard generation parameters; waits for memory and
+            # retries with back-off on OOM instead of failing straight away
+            output_text = self._generate_with_backoff(inputs)
             
             # Often the output follows the prompt. We can try to clean it if it echoes.
             # MedGemma might behave like PaliGemma where it generates the answer.
@@ -79,12 +117,206 @@ class OphthalmicScreeningAgent:
 
         except Exception as e:
             print(f"Local inference failed: {e}")
-            return {
-                "observations": [],
-                "overall_assessment": "Screening failed due to local inference error.",
-                "uncertainty_notes": str(e)
-            }
+            return self._fallback(e)
+
+        return self._parse_output(output_text)
+
+    def run_batch(
+        self,
+        patient_contexts: List[Dict[str, Any]],
+        image_paths: List[str],
+        inputs: Optional[List[Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Run screening on many images with memory-aware batching.
+
+        The batch size is picked from free memory and each request's
+        footprint. A batch that runs out of memory is split in half and
+        retried; a single image that still runs out of memory is retried
+        with back-off before falling back.
+
+        Args:
+            inputs: optional per-image results of `prepare_inputs` computed
+                ahead of time (None entries are prepared here)
+
+        Returns:
+            one screening dict per image, in input order
+        """
+        admission = self._get_admission()
+        results: List[Dict[str, Any]] = [None] * len(image_paths)
+        prepared = {}
+        inputs = inputs or [None] * len(image_paths)
+
+        for index, (patient_context, image_path) in enumerate(zip(patient_contexts, image_paths)):
+            if inputs[index] is not None:
+                prepared[index] = inputs[index]
+                continue
+            try:
+                prepared[index] = self.prepare_inputs(patient_context, image_path)
+            except Exception as e:
+                print(f"Could not prepare {image_path}: {e}")
+                results[index] = self._fallback(e)
+
+        pending = list(prepared)
+        while pending:
+            footprints = [self._footprint(prepared[index]) for index in pending]
+            size = admission.batch_size(footprints)
+            chunk, pending = pending[:size], pending[size:]
+            print(f"Running Screening Agent on batch of {len(chunk)} (queued: {len(pending)})...")
+            self._run_chunk(chunk, prepared, results)
+
+        return results
+
+    async def arun(
+        self,
+        patient_context: Dict[str, Any],
+        image_path: str
+    ) -> Dict[str, Any]:
+        """
+        Run screening agent through the shared inference engine
+        """
+        if self.engine is None:
+            raise RuntimeError("OphthalmicScreeningAgent.arun requires an inference engine")
+
+        prompt = self.build_prompt(patient_context)
+
+        try:
+            print("Submitting Screening Agent request to inference engine...")
+            raw_image = Image.open(image_path).convert("RGB")
+            output_text = await self.engine.generate(
+                prompt,
+                image=raw_image,
+                params=self.GENERATION_KWARGS
+            )
+
+        except Exception as e:
+            print(f"Local inference failed: {e}")
+            return self._fallback(e)
+
+        return self._parse_output(output_text)
+
+    def _get_admission(self) -> AdmissionController:
+        if self.admission is None:
+            self.admission = AdmissionController(self.model)
+        return self.admission
+
+    def _footprint(self, inputs) -> int:
+        return self._get_admission().estimate_bytes(
+            inputs["input_ids"].shape[1], self.GENERATION_KWARGS["max_new_tokens"]
+        )
+
+    def _generate_with_backoff(self, inputs) -> str:
+        """
+        Generate for one prepared request, retrying with back-off on OOM.
+        """
+        admission = self._get_admission()
+        attempt = 0
+        while True:
+            try:
+                with admission.reserve(self._footprint(inputs)):
+                    generate_ids = self.model.generate(
+                        **inputs.to(self.model.device),
+                        **self.GENERATION_KWARGS
+                    )
+                admission.record_success()
+                return self._decode_new_tokens(generate_ids, inputs)[0]
+
+            except Exception as e:
+                if not is_oom_error(e) or attempt >= admission.max_retries:
+                    raise
+                admission.record_oom()
+                print(f"Out of memory during screening; retry {attempt + 1} after back-off")
+                admission.backoff(attempt)
+                attempt += 1
+
+    def _run_chunk(self, chunk, prepared, results):
+        """
+        Generate for a chunk of prepared requests, splitting it on OOM.
+        """
+        if len(chunk) == 1:
+            index = chunk[0]
+            try:
+                results[index] = self._parse_output(self._generate_with_backoff(prepared[index]))
+            except Exception as e:
+                print(f"Local inference failed: {e}")
+                results[index] = self._fallback(e)
+            return
+
+        admission = self._get_admission()
+        try:
+            footprint = sum(self._footprint(prepared[index]) for index in chunk)
+            with admission.reserve(footprint):
+                texts = self._generate_batch([prepared[index] for index in chunk])
+            admission.record_success()
+
+        except Exception as e:
+            if not is_oom_error(e):
+                print(f"Local inference failed: {e}")
+                for index in chunk:
+                    results[index] = self._fallback(e)
+                return
+            admission.record_oom()
+            middle = len(chunk) // 2
+            print(f"Out of memory with batch of {len(chunk)}; splitting and retrying")
+            self._run_chunk(chunk[:middle], prepared, results)
+            self._run_chunk(chunk[middle:], prepared, results)
+            return
+
+        for index, text in zip(chunk, texts):
+            try:
+                results[index] = self._parse_output(text)
+            except json.JSONDecodeError as e:
+                results[index] = self._fallback(e)
+
+    def _generate_batch(self, prepared: List[Any]) -> List[str]:
+        """
+        One `generate` call over several prepared requests, left-padded
+        to a common length and stacked.
+        """
+        inputs = self._stack_inputs(prepared)
+        generate_ids = self.model.generate(
+            **{key: value.to(self.model.device) for key, value in inputs.items()},
+            **self.GENERATION_KWARGS
+        )
+        return self._decode_new_tokens(generate_ids, inputs)
+
+    def _stack_inputs(self, prepared: List[Any]) -> Dict[str, torch.Tensor]:
+        """
+        Left-pad per-token tensors (input_ids, attention_mask, ...) and
+        concatenate everything (including pixel_values) along the batch axis.
+        """
+        pad_token_id = self.processor.tokenizer.pad_token_id or 0
+        length = max(inputs["input_ids"].shape[1] for inputs in prepared)
+
+        stacked = {}
+        for key in prepared[0].keys():
+            tensors = []
+            for inputs in prepared:
+                tensor = inputs[key]
+                tokens = inputs["input_ids"].shape[1]
+                if tensor.dim() == 2 and tensor.shape[1] == tokens and tokens < length:
+                    fill = pad_token_id if key == "input_ids" else 0
+                    tensor = torch.nn.functional.pad(tensor, (length - tokens, 0), value=fill)
+                tensors.append(tensor)
+            stacked[key] = torch.cat(tensors, dim=0)
+        return stacked
+
+    def _decode_new_tokens(self, generate_ids, inputs) -> List[str]:
+        """
+        Decode only the generated continuation, so the JSON template in the
+        prompt is never parsed as output (same convention as `arun`).
+        """
+        new_tokens = generate_ids[:, inputs["input_ids"].shape[1]:]
+        return self.processor.batch_decode(new_tokens, skip_special_tokens=True)
+
+    def _fallback(self, error: Exception) -> Dict[str, Any]:
+        return {
+            "observations": [],
+            "overall_assessment": "Screening failed due to local inference error.",
+            "uncertainty_notes": str(error)
+        }
 
+    def _parse_output(self, output_text: str) -> Dict[str, Any]:
         # Parse JSON output
         try:
             parsed = json.loads(output_text)
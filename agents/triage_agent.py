@@ -1,30 +1,49 @@
 import json
 from typing import Dict, Any
 
+from utils.payload_serializer import PayloadSerializer
+
 class RiskAndTriageAgent:
     """
     Risk & Triage Agent
     Uses MedGemma (text-only) locally.
     """
 
+    GENERATION_KWARGS = {
+        "max_new_tokens": 256,
+        "do_sample": True,
+        "temperature": 0.2
+    }
+
     def __init__(
         self,
         model,
-        processor
+        processor,
+        engine=None,
+        compact_payloads: bool = True
     ):
+        """
+        Args:
+            model: locally loaded MedGemma model
+            processor: matching processor
+            engine: optional AsyncInferenceEngine used by `arun`
+            compact_payloads: serialize upstream results with the compact
+                encoding instead of verbose JSON
+        """
         self.model = model
         self.processor = processor
+        self.engine = engine
+        self.serializer = PayloadSerializer(compact=compact_payloads)
 
-    def run(
+    def build_prompt(
         self,
         patient_context: Dict[str, Any],
         screening_results: Dict[str, Any]
-    ) -> Dict[str, Any]:
+    ) -> str:
         """
-        Execute triage reasoning
+        Build the triage prompt
         """
-
-        prompt = (
+        return (
             "You are a Risk Stratification and Triage Agent.\n"
             "Based on the inputs, recommend a triage level (low, medium, high).\n\n"
             "Return STRICT JSON:\n"
@@ -33,9 +52,22 @@ class RiskAndTriageAgent:
             '  "reasoning": "...",\n'
             '  "recommended_action": "..."\n'
             "}\n\n"
-            f"Patient context: {json.dumps(patient_context)}\n"
-            f"Screening observations: {json.dumps(screening_results)}"
+            + self.serializer.render([
+                ("Patient context", patient_context),
+                ("Screening observations", screening_results)
+            ])
         )
+
+    def run(
+        self,
+        patient_context: Dict[str, Any],
+        screening_results: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """
+        Execute triage reasoning
+        """
+
+        prompt = self.build_prompt(patient_context, screening_results)
         
         try:
             print("Running local inference for Triage Agent...")
@@ -45,21 +77,53 @@ class RiskAndTriageAgent:
             
             generate_ids = self.model.generate(
                 **inputs,
-                max_new_tokens=256,
-                do_sample=True,
-                temperature=0.2
+                **self.GENERATION_KWARGS
             )
             
-            output_text = self.processor.batch_decode(generate_ids, skip_special_tokens=True)[0]
+            # Decode only the completion; the echoed prompt holds the output template
+            new_tokens = generate_ids[:, inputs["input_ids"].shape[1]:]
+            output_text = self.processor.batch_decode(new_tokens, skip_special_tokens=True)[0]
 
         except Exception as e:
             print(f"Local inference failed: {e}")
-            return {
-                "triage_level": "high",
-                "reasoning": f"Local inference error: {e}",
-                "recommended_action": "Refer to specialist"
-            }
-            
+            return self._fallback(e)
+
+        return self._parse_output(output_text)
+
+    async def arun(
+        self,
+        patient_context: Dict[str, Any],
+        screening_results: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """
+        Execute triage reasoning through the shared inference engine
+        """
+        if self.engine is None:
+            raise RuntimeError("RiskAndTriageAgent.arun requires an inference engine")
+
+        prompt = self.build_prompt(patient_context, screening_results)
+
+        try:
+            print("Submitting Triage Agent request to inference engine...")
+            output_text = await self.engine.generate(
+                prompt,
+                params=self.GENERATION_KWARGS
+            )
+
+        except Exception as e:
+            print(f"Local inference failed: {e}")
+            return self._fallback(e)
+
+        return self._parse_output(output_text)
+
+    def _fallback(self, error: Exception) -> Dict[str, Any]:
+        return {
+            "triage_level": "high",
+            "reasoning": f"Local inference error: {error}",
+            "recommended_action": "Refer to specialist"
+        }
+
+    def _parse_output(self, output_text: str) -> Dict[str, Any]:
         try:
             parsed = json.loads(output_text)
         except json.JSONDecodeError:
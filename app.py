@@ -1,4 +1,3 @@
-import os
 import json
 from dotenv import load_dotenv
 
@@ -11,6 +10,11 @@ from agents.screening_agent import OphthalmicScreeningAgent
 from agents.triage_agent import RiskAndTriageAgent
 from agents.documentation_agent import ClinicalDocumentationAgent
 from agents.patient_communication_agent import PatientCommunicationAgent
+from models.medgemma_loader import MedGemmaLoader
+from models.inference_engine import AsyncInferenceEngine
+
+# Longest a session waits on the shared engine for one agent's output
+REQUEST_TIMEOUT_SECONDS = 600
 
 
 st.set_page_config(
@@ -24,6 +28,54 @@ st.caption(
     "in resource-limited clinical settings."
 )
 
+
+def start_engine(model, processor):
+    """
+    Build and start the inference engine the agents' `arun` calls go through.
+    """
+    engine = AsyncInferenceEngine(model, processor)
+    engine.start_in_thread()
+    return engine
+
+
+@st.cache_resource
+def get_loader():
+    """
+    Start loading and warming up MedGemma in the background as soon as the
+    app starts, so the first real request sees steady-state latency.
+    Warmup runs through the inference engine, so "ready" covers the
+    path app requests actually take.
+    """
+    loader = MedGemmaLoader()
+    loader.load_in_background(warmup=True, engine_factory=start_engine)
+    return loader
+
+
+@st.cache_resource
+def get_inference_engine():
+    """
+    Share one inference engine across every browser session, so
+    concurrent clinicians are batched together.
+    """
+    loader = get_loader()
+    loader.wait_until_ready()
+    return loader.engine
+
+
+def run_agent(engine, coro):
+    """
+    Run an agent's `arun` on the shared engine, stopping the page on timeout.
+    """
+    try:
+        return engine.run_sync(coro, timeout=REQUEST_TIMEOUT_SECONDS)
+    except TimeoutError as e:
+        st.error(f"Model did not respond: {e}")
+        st.stop()
+
+
+loader = get_loader()
+
+
 # ---------------- Sidebar: Patient Intake ----------------
 st.sidebar.header("🧾 Patient Intake")
 
@@ -46,6 +98,13 @@ uploaded_image = st.sidebar.file_uploader(
 
 run_button = st.sidebar.button("▶️ Run Screening Workflow")
 
+if loader.state == "failed":
+    st.sidebar.error(f"Model failed to load: {loader.error}")
+elif not loader.is_ready:
+    st.sidebar.info(f"⏳ Model {loader.state.replace('_', ' ')}… first results will be available shortly.")
+else:
+    st.sidebar.success("✅ Model ready")
+
 # ---------------- Main Logic ----------------
 if run_button:
     if uploaded_image is None:
@@ -62,10 +121,16 @@ if run_button:
         "symptoms": symptoms.split(",") if symptoms else []
     }
 
-    hf_api_token = os.getenv("HF_API_TOKEN")
-    if not hf_api_token:
-        st.error("HF_API_TOKEN environment variable not set.")
-        st.stop()
+    if not loader.is_ready:
+        with st.spinner("Warming up model..."):
+            try:
+                loader.wait_until_ready()
+            except RuntimeError as e:
+                st.error(str(e))
+                st.stop()
+
+    engine = get_inference_engine()
+    model, processor = engine.model, engine.processor
 
     st.subheader("🔁 Agentic Workflow Execution")
 
@@ -81,14 +146,20 @@ if run_button:
 
     # -------- Agent 2: Screening --------
     with st.expander("2️⃣ Screening Agent (MedGemma – Multimodal)", expanded=True):
-        screening_agent = OphthalmicScreeningAgent(hf_api_token)
-        screening_results = screening_agent.run(patient_context, image_path)
+        screening_agent = OphthalmicScreeningAgent(model, processor, engine=engine)
+        screening_results = run_agent(
+            engine,
+            screening_agent.arun(patient_context, image_path)
+        )
         st.json(screening_results)
 
     # -------- Agent 3: Triage --------
     with st.expander("3️⃣ Risk & Triage Agent", expanded=True):
-        triage_agent = RiskAndTriageAgent(hf_api_token)
-        triage_results = triage_agent.run(patient_context, screening_results)
+        triage_agent = RiskAndTriageAgent(model, processor, engine=engine)
+        triage_results = run_agent(
+            engine,
+            triage_agent.arun(patient_context, screening_results)
+        )
         st.json(triage_results)
 
     # -------- Agent 4 & 5: Outputs --------
@@ -97,22 +168,28 @@ if run_button:
     )
 
     with clinician_tab:
-        documentation_agent = ClinicalDocumentationAgent(hf_api_token)
-        clinical_note = documentation_agent.run(
-            patient_context,
-            intake_results,
-            screening_results,
-            triage_results
+        documentation_agent = ClinicalDocumentationAgent(model, processor, engine=engine)
+        clinical_note = run_agent(
+            engine,
+            documentation_agent.arun(
+                patient_context,
+                intake_results,
+                screening_results,
+                triage_results
+            )
         )
         st.subheader("📄 Clinical Screening Note")
         st.text_area("", clinical_note, height=300)
 
     with patient_tab:
-        patient_agent = PatientCommunicationAgent(hf_api_token)
-        patient_message = patient_agent.run(
-            patient_context,
-            screening_results,
-            triage_results
+        patient_agent = PatientCommunicationAgent(model, processor, engine=engine)
+        patient_message = run_agent(
+            engine,
+            patient_agent.arun(
+                patient_context,
+                screening_results,
+                triage_results
+            )
         )
         st.subheader("💬 Patient Explanation")
         st.text_area("", patient_message, height=200)
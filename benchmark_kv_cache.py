@@ -0,0 +1,200 @@
+import argparse
+import os
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+import torch
+
+from agents.documentation_agent import ClinicalDocumentationAgent
+from models.medgemma_loader import MedGemmaLoader, KV_CACHE_STRATEGIES
+
+# Representative documentation inputs: the longest prompt in the workflow
+SAMPLE_PATIENT = {
+    "age": 59,
+    "known_conditions": ["diabetes", "hypertension"],
+    "symptoms": ["blurred vision", "floaters"],
+    "language_preference": "English"
+}
+SAMPLE_INTAKE = {
+    "input_valid": True,
+    "image_quality": "marginal",
+    "limitations": ["image appears blurry"],
+    "recommendation": "proceed"
+}
+SAMPLE_SCREENING = {
+    "observations": [
+        {"feature": "microaneurysms", "location": "inferotemporal arcade", "confidence": "moderate"},
+        {"feature": "dot-blot haemorrhages", "location": "posterior pole", "confidence": "moderate"},
+        {"feature": "hard exudates", "location": "near macula", "confidence": "low"}
+    ],
+    "overall_assessment": "Features consistent with non-proliferative changes warranting review.",
+    "uncertainty_notes": "Mild blur limits assessment of the macular region and peripheral retina."
+}
+SAMPLE_TRIAGE = {
+    "triage_level": "medium",
+    "reasoning": "Multiple microvascular features in a diabetic patient with visual symptoms.",
+    "recommended_action": "Refer to ophthalmology within 4 weeks"
+}
+
+
+def host_rss_bytes() -> int:
+    """
+    Resident host memory of this process (psutil if installed, else /proc).
+    """
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def available_host_bytes() -> int:
+    """
+    Available host RAM (psutil if installed, else /proc/meminfo).
+    """
+    try:
+        import psutil
+        return psutil.virtual_memory().available
+    except ImportError:
+        pass
+    with open("/proc/meminfo") as f:
+        for line in f:
+            if line.startswith("MemAvailable:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+class HostPeakSampler:
+    """
+    Samples process RSS on a background thread to find the peak host
+    memory of a generation (the offloaded cache lives in host RAM).
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, host_rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = host_rss_bytes()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, host_rss_bytes())
+
+
+def measure_strategy(model, loader, strategy, inputs, max_new_tokens):
+    """
+    Run one documentation generation and return peak KV/activation bytes
+    above the resident model weights, on the device and in host RAM.
+    """
+    loader.kv_cache = strategy
+    loader.apply_kv_cache(model)
+
+    torch.cuda.empty_cache()
+    torch.cuda.synchronize()
+    baseline = torch.cuda.memory_allocated()
+    torch.cuda.reset_peak_memory_stats()
+    host_baseline = host_rss_bytes()
+
+    generation_kwargs = dict(ClinicalDocumentationAgent.GENERATION_KWARGS)
+    generation_kwargs["max_new_tokens"] = max_new_tokens
+    # Force the full decode length so every strategy holds the same number of tokens
+    generation_kwargs["min_new_tokens"] = max_new_tokens
+
+    with HostPeakSampler() as host:
+        with torch.inference_mode():
+            model.generate(**inputs, **generation_kwargs)
+        torch.cuda.synchronize()
+
+    device_peak = torch.cuda.max_memory_allocated() - baseline
+    host_peak = max(host.peak - host_baseline, 0)
+    return device_peak, host_peak
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Peak memory per KV-cache strategy for the documentation prompt"
+    )
+    parser.add_argument(
+        "--strategies", nargs="+", default=list(KV_CACHE_STRATEGIES),
+        choices=list(KV_CACHE_STRATEGIES)
+    )
+    parser.add_argument(
+        "--budget-gb", type=float, default=None,
+        help="Memory budget for concurrency estimate (default: total device memory)"
+    )
+    parser.add_argument(
+        "--host-budget-gb", type=float, default=None,
+        help="Host RAM budget for concurrency estimate (default: currently available RAM)"
+    )
+    parser.add_argument(
+        "--max-new-tokens", type=int,
+        default=ClinicalDocumentationAgent.GENERATION_KWARGS["max_new_tokens"]
+    )
+    args = parser.parse_args()
+
+    if not torch.cuda.is_available():
+        print("CUDA device required: peak usage is measured with torch.cuda memory stats.")
+        return
+
+    loader = MedGemmaLoader()
+    model, processor = loader.load_model()
+
+    weights_bytes = torch.cuda.memory_allocated()
+    if args.budget_gb is not None:
+        budget_bytes = int(args.budget_gb * 1024 ** 3)
+    else:
+        budget_bytes = torch.cuda.mem_get_info()[1]
+    if args.host_budget_gb is not None:
+        host_budget_bytes = int(args.host_budget_gb * 1024 ** 3)
+    else:
+        host_budget_bytes = available_host_bytes()
+
+    agent = ClinicalDocumentationAgent(model, processor)
+    prompt = agent.build_prompt(
+        SAMPLE_PATIENT, SAMPLE_INTAKE, SAMPLE_SCREENING, SAMPLE_TRIAGE
+    )
+    inputs = processor(text=prompt, return_tensors="pt").to(model.device)
+    prompt_tokens = inputs["input_ids"].shape[1]
+
+    print(f"\nPrompt tokens: {prompt_tokens}, new tokens: {args.max_new_tokens}")
+    print(f"Model weights: {weights_bytes / 1024 ** 2:.0f} MiB, "
+          f"budget: {budget_bytes / 1024 ** 3:.1f} GiB, "
+          f"host budget: {host_budget_bytes / 1024 ** 3:.1f} GiB\n")
+    print(f"{'strategy':<12}{'device peak (MiB)':>20}{'host peak (MiB)':>18}{'max concurrent':>16}")
+
+    for strategy in args.strategies:
+        try:
+            device_peak, host_peak = measure_strategy(
+                model, loader, strategy, inputs, args.max_new_tokens
+            )
+        except Exception as e:
+            print(f"{strategy:<12}{'unsupported':>20}{'-':>18}{'-':>16}  ({e})")
+            continue
+
+        # Sessions are limited by whichever memory runs out first
+        limits = []
+        if device_peak > 0:
+            limits.append((budget_bytes - weights_bytes) // device_peak)
+        if host_peak > 0:
+            limits.append(host_budget_bytes // host_peak)
+        sessions = max(min(limits), 0) if limits else 0
+        print(f"{strategy:<12}{device_peak / 1024 ** 2:>20.1f}"
+              f"{host_peak / 1024 ** 2:>18.1f}{sessions:>16}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Optional
+
+import torch
+
+# Multiplier on KV bytes for prefill activations, logits and allocator slack
+ACTIVATION_OVERHEAD = 0.5
+
+# Last-position logits are kept in fp32 and copied by the logits
+# processors and softmax while sampling
+LOGITS_BYTES_PER_VOCAB_ENTRY = 4 * 3
+
+# Memory kept free for the OS, other processes and fragmentation
+DEFAULT_RESERVE_BYTES = 512 * 1024 ** 2
+
+
+def is_oom_error(error: BaseException) -> bool:
+    """
+    True for GPU or host out-of-memory failures raised during generation.
+    """
+    if isinstance(error, MemoryError):
+        return True
+    oom_type = getattr(torch.cuda, "OutOfMemoryError", None)
+    if oom_type is not None and isinstance(error, oom_type):
+        return True
+    message = str(error).lower()
+    return "out of memory" in message or "can't allocate memory" in message
+
+
+class AdmissionController:
+    """
+    Resource-aware admission for generation requests.
+
+    Estimates each request's footprint (image tokens + prompt tokens +
+    max_new_tokens worth of KV cache plus activation overhead, and the
+    last-position logits used for sampling) from the model config, measures free VRAM (or host RAM on CPU-only machines)
+    and picks the largest batch that fits. After an OOM the footprint
+    estimate is scaled up, and it relaxes again after successful runs.
+    """
+
+    def __init__(
+        self,
+        model,
+        kv_cache: Optional[str] = None,
+        reserve_bytes: int = DEFAULT_RESERVE_BYTES,
+        max_batch_size: int = 16,
+        max_retries: int = 3,
+        backoff_seconds: float = 0.5
+    ):
+        """
+        Args:
+            model: model returned by MedGemmaLoader.load_model()
+            kv_cache: cache layout the caller actually uses ("dynamic",
+                "static", "quantized" or "offloaded"); defaults to the
+                model generation config's cache_implementation, which is
+                what `model.generate` uses
+            reserve_bytes: memory never handed out to requests
+            max_batch_size: upper bound regardless of free memory
+            max_retries: retries for a single request that still OOMs alone
+            backoff_seconds: initial wait before such a retry (doubles each time)
+        """
+        self.model = model
+        self.reserve_bytes = reserve_bytes
+        self.max_batch_size = max_batch_size
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+
+        self.kv_bytes_per_token = self._kv_bytes_per_token(model, kv_cache)
+        self.logits_bytes = self._logits_bytes(model)
+        self.footprint_scale = 1.0
+        self._lock = threading.Lock()
+
+        # Reservations held by concurrent callers (threads) of `reserve`
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._in_flight_bytes = 0
+        self._budget = 0
+
+    # ---------------- Measurements ----------------
+
+    def free_bytes(self) -> int:
+        """
+        Memory currently available for new requests on the model's device.
+        """
+        device = getattr(self.model, "device", torch.device("cpu"))
+        if device.type == "cuda" and torch.cuda.is_available():
+            free, _ = torch.cuda.mem_get_info(device)
+            # Blocks cached by PyTorch but not in use are reusable too
+            free += torch.cuda.memory_reserved(device) - torch.cuda.memory_allocated(device)
+        else:
+            free = _available_host_memory()
+        return max(free - self.reserve_bytes, 0)
+
+    def estimate_bytes(self, input_tokens: int, max_new_tokens: int) -> int:
+        """
+        Estimated peak footprint of one request.
+
+        Args:
+            input_tokens: prompt tokens, including expanded image tokens
+            max_new_tokens: decode budget of the request
+        """
+        kv = self.kv_bytes_per_token * (input_tokens + max_new_tokens)
+        with self._lock:
+            scale = self.footprint_scale
+        return int((kv * (1.0 + ACTIVATION_OVERHEAD) + self.logits_bytes) * scale)
+
+    # ---------------- Decisions ----------------
+
+    def batch_size(self, footprints: List[int], free_bytes: Optional[int] = None) -> int:
+        """
+        Largest prefix of `footprints` (in order) that fits in free memory.
+
+        Always admits at least one request so work can make progress; a
+        request too large to fit alone is handled by OOM back-off.
+        """
+        budget = self.free_bytes() if free_bytes is None else free_bytes
+        used = 0
+        admitted = 0
+        for footprint in footprints[:self.max_batch_size]:
+            if admitted > 0 and used + footprint > budget:
+                break
+            used += footprint
+            admitted += 1
+        return admitted
+
+    def can_admit(self, footprint: int, reserved_bytes: int = 0) -> bool:
+        """
+        Whether a new request fits in free memory.
+
+        Args:
+            footprint: estimated bytes of the new request
+            reserved_bytes: memory promised to admitted requests but not yet
+                allocated (e.g. the remaining decode growth of in-flight
+                sequences in the continuous-batching engine)
+        """
+        return footprint + reserved_bytes <= self.free_bytes()
+
+    @contextmanager
+    def reserve(self, footprint: int):
+        """
+        Block until `footprint` fits next to other in-flight reservations.
+
+        Used by synchronous callers running on several threads (e.g.
+        pipeline workers). The budget is measured when the first request
+        is admitted, before in-flight requests start allocating.
+        """
+        with self._condition:
+            while self._in_flight and self._in_flight_bytes + footprint > self._budget:
+                self._condition.wait()
+            if not self._in_flight:
+                self._budget = self.free_bytes()
+            self._in_flight += 1
+            self._in_flight_bytes += footprint
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._in_flight -= 1
+                self._in_flight_bytes -= footprint
+                self._condition.notify_all()
+
+    def record_oom(self):
+        """
+        Make future estimates more conservative and release cached blocks.
+        """
+        with self._lock:
+            self.footprint_scale = min(self.footprint_scale * 1.5, 8.0)
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def record_success(self):
+        """
+        Relax the OOM penalty gradually after successful runs.
+        """
+        with self._lock:
+            self.footprint_scale = max(1.0, self.footprint_scale * 0.95)
+
+    def backoff(self, attempt: int):
+        """
+        Sleep before retrying a request that ran out of memory on its own.
+        """
+        time.sleep(self.backoff_seconds * (2 ** attempt))
+
+    # ---------------- Helpers ----------------
+
+    def _kv_bytes_per_token(self, model, kv_cache: Optional[str] = None) -> int:
+        """
+        Bytes of KV cache per token for the given (or configured) cache layout.
+        """
+        config = getattr(model.config, "text_config", model.config)
+        layers = config.num_hidden_layers
+        attention_heads = config.num_attention_heads
+        kv_heads = getattr(config, "num_key_value_heads", None) or attention_heads
+        head_dim = getattr(config, "head_dim", None) or config.hidden_size // attention_heads
+
+        generation_config = getattr(model, "generation_config", None)
+        cache_implementation = kv_cache or getattr(generation_config, "cache_implementation", None)
+        cache_config = getattr(generation_config, "cache_config", None) or {}
+
+        bytes_per_element = 2.0  # fp16 compute dtype
+        if cache_implementation == "quantized":
+            nbits = cache_config.get("nbits", 4) if isinstance(cache_config, dict) else 4
+            bytes_per_element = nbits / 8
+        elif cache_implementation == "offloaded":
+            # Only the current and prefetched layer are resident on the device
+            layers = min(layers, 2)
+
+        return int(2 * layers * kv_heads * head_dim * bytes_per_element)
+
+    def _logits_bytes(self, model) -> int:
+        """
+        Bytes of last-position logits (and their sampling copies) per request.
+        """
+        config = getattr(model.config, "text_config", model.config)
+        vocab_size = getattr(config, "vocab_size", None) or 0
+        return vocab_size * LOGITS_BYTES_PER_VOCAB_ENTRY
+
+
+def _available_host_memory() -> int:
+    """
+    Available host RAM in bytes (psutil if installed, else /proc/meminfo).
+    """
+    try:
+        import psutil
+        return psutil.virtual_memory().available
+    except ImportError:
+        pass
+
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
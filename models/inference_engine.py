@@ -0,0 +1,670 @@
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Union
+
+import torch
+from PIL import Image
+from transformers import DynamicCache
+
+from models.admission_control import AdmissionController, is_oom_error
+
+
+# Used for fields set neither by the request nor by the model's generation config
+_DEFAULT_PARAMS = {
+    "max_new_tokens": 256,
+    "do_sample": False,
+    "temperature": 1.0,
+    "top_k": 0,
+    "top_p": 1.0,
+}
+
+
+@dataclass
+class GenerationParams:
+    """
+    Per-request sampling parameters.
+
+    Field names mirror the `model.generate` kwargs used by the agents so an
+    agent's GENERATION_KWARGS dict can be passed straight through. Fields
+    the request leaves unset are taken from the model's generation config
+    (e.g. Gemma-3's top_k=64, top_p=0.95), as `model.generate` does.
+    """
+
+    max_new_tokens: Optional[int] = None
+    do_sample: Optional[bool] = None
+    temperature: Optional[float] = None
+    top_k: Optional[int] = None
+    top_p: Optional[float] = None
+
+    @classmethod
+    def from_kwargs(
+        cls,
+        params: Union["GenerationParams", Dict[str, Any], None],
+        generation_config=None
+    ) -> "GenerationParams":
+        if isinstance(params, cls):
+            params = asdict(params)
+        given = {
+            k: v for k, v in (params or {}).items()
+            if k in cls.__dataclass_fields__ and v is not None
+        }
+
+        resolved = {}
+        for name in cls.__dataclass_fields__:
+            value = given.get(name)
+            if value is None:
+                value = getattr(generation_config, name, None)
+            resolved[name] = _DEFAULT_PARAMS[name] if value is None else value
+        return cls(**resolved)
+
+
+class _Sequence:
+    """
+    Book-keeping for one request while it is in flight.
+    """
+
+    def __init__(self, prompt: str, image, params: GenerationParams, future):
+        self.prompt = prompt
+        self.image = image
+        self.params = params
+        self.future = future
+
+        # Processor outputs (kept on the CPU until prefill) and their length
+        self.inputs = None
+        self.input_tokens = 0
+        self.oom_attempts = 0
+        self.out_of_memory = False
+
+        # Per-layer (key, value) tensors of shape (1, heads, length, head_dim),
+        # held from prefill until the sequence joins the batched cache
+        self.cache: Optional[List[tuple]] = None
+        self.length = 0
+        self.next_token: Optional[int] = None
+        self.generated: List[int] = []
+        self.finished = False
+        self.error: Optional[BaseException] = None
+
+    def reset(self):
+        """
+        Drop decode state so the sequence can be prefilled again later.
+        """
+        self.cache = None
+        self.length = 0
+        self.next_token = None
+        self.generated = []
+        self.out_of_memory = False
+
+
+class AsyncInferenceEngine:
+    """
+    Asyncio front-end for a model loaded by MedGemmaLoader.
+
+    Agents submit `await engine.generate(prompt, image, params)`. A single
+    scheduler task runs iteration-level (continuous) batching: every decode
+    step advances all in-flight sequences by one token, and requests that
+    arrive mid-decode are prefilled and join the batch at the next step
+    instead of waiting for the current batch to drain.
+
+    In-flight sequences share one left-padded batched KV cache that is
+    carried across decode steps; it is re-stacked only when sequences join
+    or leave the batch.
+
+    Model calls are blocking, so they run on a dedicated single-thread
+    executor; the event loop stays free to accept new requests.
+
+    An AdmissionController gates each join: a request is prefilled only if
+    its estimated footprint plus the remaining decode growth of in-flight
+    sequences fits in free memory; otherwise it waits. On OOM the newest
+    half of the batch is preempted and re-queued, and a sequence that runs
+    out of memory on its own is retried with back-off.
+    """
+
+    def __init__(
+        self,
+        model,
+        processor,
+        max_batch_size: int = 8,
+        admission: Optional[AdmissionController] = None
+    ):
+        """
+        Args:
+            model: model returned by MedGemmaLoader.load_model()
+            processor: processor returned by MedGemmaLoader.load_model()
+            max_batch_size: maximum number of sequences decoded together
+            admission: memory-aware admission policy (created from the
+                model config when omitted); pass one built with
+                kv_cache="dynamic", since that is the cache the engine keeps
+        """
+        self.model = model
+        self.processor = processor
+        self.max_batch_size = max_batch_size
+        # The engine always keeps an fp16 DynamicCache for every layer,
+        # whatever KV-cache strategy the generation config names
+        self.admission = admission or AdmissionController(model, kv_cache="dynamic")
+
+        eos = model.generation_config.eos_token_id
+        if eos is None:
+            eos = []
+        elif isinstance(eos, int):
+            eos = [eos]
+        self.eos_token_ids = set(eos)
+
+        self._pending: Optional[asyncio.Queue] = None
+        # Requests taken off `_pending` (or preempted) but not yet admitted
+        self._waiting: deque = deque()
+        self._active: List[_Sequence] = []
+        # Admitted this iteration but not yet prefilled into `_active`
+        self._joining: List[_Sequence] = []
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._executor = None
+
+        # Batched cache of the sequences in `_rows` (row i holds _rows[i]);
+        # each row's tokens are right-aligned to `_cache_len`
+        self._cache: Optional[DynamicCache] = None
+        self._rows: List[_Sequence] = []
+        self._cache_len = 0
+
+    # ---------------- Lifecycle ----------------
+
+    async def start(self):
+        """
+        Start the scheduler on the running event loop.
+        """
+        if self._task is not None:
+            return
+        from concurrent.futures import ThreadPoolExecutor
+
+        self._loop = asyncio.get_running_loop()
+        self._pending = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="eyeaid-inference"
+        )
+        self._task = asyncio.create_task(self._scheduler())
+        self._task.add_done_callback(self._on_scheduler_done)
+
+    async def stop(self):
+        """
+        Cancel the scheduler and fail any requests still in flight.
+        """
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._executor.shutdown(wait=False)
+
+    def start_in_thread(self):
+        """
+        Run the engine on its own event loop in a daemon thread.
+
+        Used by synchronous hosts (Streamlit, scripts) that share one engine
+        across threads; submit work with `run_sync`.
+        """
+        if self._thread is not None:
+            return
+        loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def _serve():
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(self.start())
+            ready.set()
+            loop.run_forever()
+
+        self._thread = threading.Thread(
+            target=_serve, name="eyeaid-engine-loop", daemon=True
+        )
+        self._thread.start()
+        ready.wait()
+
+    def run_sync(self, coro, timeout: Optional[float] = None):
+        """
+        Run a coroutine (e.g. `agent.arun(...)`) on the engine thread and
+        block until it completes.
+
+        Args:
+            timeout: seconds to wait before cancelling the coroutine and
+                raising TimeoutError (None waits indefinitely)
+        """
+        if self._thread is None:
+            raise RuntimeError("Call start_in_thread() before run_sync()")
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise TimeoutError(f"Inference request timed out after {timeout}s")
+
+    # ---------------- Public API ----------------
+
+    async def generate(
+        self,
+        prompt: str,
+        image: Union[str, Image.Image, None] = None,
+        params: Union[GenerationParams, Dict[str, Any], None] = None
+    ) -> str:
+        """
+        Generate a completion for a single prompt.
+
+        Args:
+            prompt: text prompt
+            image: optional PIL image or path to an image file
+            params: GenerationParams or a dict of generate-style kwargs
+
+        Returns:
+            decoded completion text (the prompt is not echoed)
+        """
+        if self._task is None:
+            await self.start()
+        elif self._task.done():
+            raise RuntimeError("Inference engine scheduler is not running")
+
+        future = self._loop.create_future()
+        params = GenerationParams.from_kwargs(params, self.model.generation_config)
+        seq = _Sequence(prompt, image, params, future)
+        await self._pending.put(seq)
+        return await future
+
+    # ---------------- Scheduler ----------------
+
+    async def _scheduler(self):
+        while True:
+            try:
+                await self._iterate()
+            except Exception as e:
+                # Fail the requests this iteration was working on and keep serving
+                print(f"Inference engine step failed: {e}")
+                self._fail_in_flight(e)
+
+    async def _iterate(self):
+        loop = asyncio.get_running_loop()
+
+        if not self._active and not self._waiting:
+            # Idle: block until a request arrives
+            self._waiting.append(await self._pending.get())
+        while not self._pending.empty():
+            self._waiting.append(self._pending.get_nowait())
+
+        while self._waiting and len(self._active) + len(self._joining) < self.max_batch_size:
+            seq = self._waiting[0]
+            if seq.future.done():
+                # Caller gave up (e.g. run_sync timeout)
+                self._waiting.popleft()
+                continue
+            if seq.inputs is None and not seq.finished:
+                await loop.run_in_executor(self._executor, self._prepare, seq)
+            if not seq.finished and not self._fits(seq, self._joining):
+                # Queue excess requests until in-flight ones free memory
+                break
+            self._waiting.popleft()
+            self._joining.append(seq)
+
+        deferred = []
+        while self._joining:
+            seq = self._joining[0]
+            if not seq.finished:
+                await loop.run_in_executor(self._executor, self._prefill, seq)
+            self._joining.pop(0)
+            if seq.out_of_memory and self._active:
+                # Wait for in-flight sequences to finish and free memory
+                self.admission.record_oom()
+                seq.out_of_memory = False
+                deferred.append(seq)
+            elif seq.out_of_memory:
+                await self._handle_oom([seq])
+            else:
+                self._active.append(seq)
+        self._waiting.extendleft(reversed(deferred))
+
+        for seq in self._active:
+            if seq.future.done():
+                # Stop decoding for callers that gave up
+                seq.finished = True
+        running = [seq for seq in self._active if not seq.finished]
+        if running:
+            out_of_memory = await loop.run_in_executor(
+                self._executor, self._decode_step, running
+            )
+            if out_of_memory:
+                await self._handle_oom(running)
+            else:
+                self.admission.record_success()
+
+        self._retire()
+
+    def _fail_in_flight(self, error: Exception):
+        """
+        Fail the sequences an iteration was processing when it raised.
+        """
+        failed = self._active + self._joining
+        if not failed and self._waiting:
+            # The failure was in admitting the head of the queue
+            failed = [self._waiting.popleft()]
+        for seq in failed:
+            if not seq.future.done():
+                seq.future.set_exception(error)
+        self._active = []
+        self._joining = []
+        self._release_cache()
+
+    def _on_scheduler_done(self, task: asyncio.Task):
+        """
+        Fail every request still queued once the scheduler task exits.
+        """
+        if task.cancelled():
+            error = RuntimeError("Inference engine stopped")
+        else:
+            print(f"Inference engine scheduler exited: {task.exception()}")
+            error = RuntimeError(f"Inference engine scheduler exited: {task.exception()}")
+
+        queued = self._active + self._joining + list(self._waiting)
+        while not self._pending.empty():
+            queued.append(self._pending.get_nowait())
+        for seq in queued:
+            if not seq.future.done():
+                seq.future.set_exception(error)
+        self._active = []
+        self._joining = []
+        self._waiting.clear()
+        self._release_cache()
+
+    def _fits(self, seq: _Sequence, admitted: List[_Sequence]) -> bool:
+        """
+        Whether `seq` can join next to the in-flight and just-admitted sequences.
+        """
+        if not self._active and not admitted:
+            # Always make progress; an oversized request is handled by OOM back-off
+            return True
+
+        reserved = sum(
+            self.admission.estimate_bytes(0, s.params.max_new_tokens - len(s.generated))
+            for s in self._active if not s.finished
+        )
+        reserved += sum(
+            self.admission.estimate_bytes(s.input_tokens, s.params.max_new_tokens)
+            for s in admitted if not s.finished
+        )
+        # Joining re-stacks the batched cache: the old and new copies coexist
+        # until the restack completes
+        reserved += self.admission.kv_bytes_per_token * len(self._rows) * self._cache_len
+        footprint = self.admission.estimate_bytes(seq.input_tokens, seq.params.max_new_tokens)
+        return self.admission.can_admit(footprint, reserved)
+
+    async def _handle_oom(self, batch: List[_Sequence]):
+        """
+        Back off after an out-of-memory failure.
+
+        A batch is split: its newest half is preempted back to the front of
+        the waiting queue and will be prefilled again once memory allows.
+        A single sequence is retried after a delay, up to max_retries.
+        """
+        self.admission.record_oom()
+
+        if len(batch) > 1:
+            preempted = batch[len(batch) // 2:]
+            print(f"Out of memory with batch of {len(batch)}; preempting {len(preempted)} request(s)")
+            for seq in reversed(preempted):
+                self._active.remove(seq)
+                seq.reset()
+                self._waiting.appendleft(seq)
+            return
+
+        seq = batch[0]
+        seq.out_of_memory = False
+        seq.oom_attempts += 1
+        if seq.oom_attempts > self.admission.max_retries:
+            seq.error = MemoryError(
+                f"Out of memory after {self.admission.max_retries} retries"
+            )
+            seq.finished = True
+            if seq not in self._active:
+                self._active.append(seq)
+            return
+
+        print(f"Out of memory on a single request; retry {seq.oom_attempts} after back-off")
+        await asyncio.sleep(self.admission.backoff_seconds * (2 ** (seq.oom_attempts - 1)))
+        if seq.length == 0:
+            # Failed during prefill: queue it again at the front
+            if seq in self._active:
+                self._active.remove(seq)
+            self._waiting.appendleft(seq)
+
+    def _retire(self):
+        still_active = []
+        for seq in self._active:
+            if not seq.finished:
+                still_active.append(seq)
+                continue
+            seq.cache = None
+            if seq.future.done():
+                continue
+            if seq.error is not None:
+                seq.future.set_exception(seq.error)
+                continue
+            try:
+                text = self.processor.batch_decode(
+                    [seq.generated], skip_special_tokens=True
+                )[0]
+                seq.future.set_result(text.strip())
+            except Exception as e:
+                seq.future.set_exception(e)
+        self._active = still_active
+        if not self._active:
+            self._release_cache()
+
+    def _release_cache(self):
+        self._cache = None
+        self._rows = []
+        self._cache_len = 0
+
+    # ---------------- Model steps (executor thread) ----------------
+
+    def _prepare(self, seq: _Sequence):
+        """
+        Run the processor on the CPU so the request's size is known before admission.
+        """
+        try:
+            image = seq.image
+            if isinstance(image, str):
+                image = Image.open(image).convert("RGB")
+
+            if image is not None:
+                seq.inputs = self.processor(
+                    text=seq.prompt, images=image, return_tensors="pt"
+                )
+            else:
+                seq.inputs = self.processor(text=seq.prompt, return_tensors="pt")
+            seq.input_tokens = seq.inputs["input_ids"].shape[1]
+
+        except Exception as e:
+            seq.error = e
+            seq.finished = True
+
+    def _prefill(self, seq: _Sequence):
+        try:
+            inputs = seq.inputs.to(self.model.device)
+
+            with torch.inference_mode():
+                # Only the last position's logits are needed; full-vocab logits
+                # for every prompt token would dwarf the KV cache
+                out = self.model(**inputs, use_cache=True, logits_to_keep=1)
+
+            seq.cache = _cache_to_layers(out.past_key_values)
+            seq.length = inputs["input_ids"].shape[1]
+            self._accept_token(seq, out.logits[:, -1][0])
+
+        except Exception as e:
+            if is_oom_error(e):
+                seq.reset()
+                seq.out_of_memory = True
+                return
+            seq.error = e
+            seq.finished = True
+
+    def _decode_step(self, batch: List[_Sequence]) -> bool:
+        """
+        Advance every sequence in `batch` by one token.
+
+        The batched cache from the previous step is reused as-is; it is only
+        re-stacked when `batch` differs from the rows it holds. Padding
+        positions are masked out via the attention mask.
+
+        Returns:
+            True if the step ran out of memory (sequences are left unchanged)
+        """
+        device = self.model.device
+
+        if self._rows != batch:
+            try:
+                self._restack(batch)
+            except Exception as e:
+                if is_oom_error(e):
+                    return True
+                raise
+
+        max_len = self._cache_len
+        attention_mask = torch.zeros(
+            (len(batch), max_len + 1), dtype=torch.long, device=device
+        )
+        for row, seq in enumerate(batch):
+            attention_mask[row, max_len - seq.length:] = 1
+
+        input_ids = torch.tensor(
+            [[seq.next_token] for seq in batch], dtype=torch.long, device=device
+        )
+        position_ids = torch.tensor(
+            [[seq.length] for seq in batch], dtype=torch.long, device=device
+        )
+        cache_position = torch.tensor([max_len], dtype=torch.long, device=device)
+
+        try:
+            with torch.inference_mode():
+                out = self.model(
+                    input_ids=input_ids,
+                    attention_mask=attention_mask,
+                    position_ids=position_ids,
+                    past_key_values=self._cache,
+                    cache_position=cache_position,
+                    use_cache=True,
+                    logits_to_keep=1
+                )
+        except Exception as e:
+            if is_oom_error(e):
+                # Drop the keys this step already appended for some layers
+                self._cache.crop(max_len)
+                return True
+            self._release_cache()
+            for seq in batch:
+                seq.error = e
+                seq.finished = True
+            return False
+
+        self._cache = out.past_key_values
+        self._cache_len += 1
+        for row, seq in enumerate(batch):
+            seq.length += 1
+            self._accept_token(seq, out.logits[:, -1][row])
+        return False
+
+    def _restack(self, batch: List[_Sequence]):
+        """
+        Rebuild the batched cache for `batch` after sequences joined or left.
+
+        Rows already in the batched cache are sliced out of it; newly
+        prefilled sequences contribute their own caches. Everything is
+        left-padded to the longest sequence, so columns that were padding
+        for every remaining row are dropped. The current cache is only
+        replaced once the new one is complete.
+        """
+        old_layers = _cache_to_layers(self._cache) if self._cache is not None else []
+        old_rows = {id(seq): row for row, seq in enumerate(self._rows)}
+        max_len = max(seq.length for seq in batch)
+        num_layers = len(old_layers) or len(batch[0].cache)
+
+        def row_cache(seq, layer_idx, part):
+            row = old_rows.get(id(seq))
+            if row is None:
+                return seq.cache[layer_idx][part]
+            tensor = old_layers[layer_idx][part]
+            return tensor[row:row + 1, :, self._cache_len - seq.length:]
+
+        cache = DynamicCache()
+        for layer_idx in range(num_layers):
+            keys = torch.cat(
+                [_left_pad(row_cache(seq, layer_idx, 0), max_len) for seq in batch], dim=0
+            )
+            values = torch.cat(
+                [_left_pad(row_cache(seq, layer_idx, 1), max_len) for seq in batch], dim=0
+            )
+            cache.update(keys, values, layer_idx)
+
+        self._cache = cache
+        self._rows = list(batch)
+        self._cache_len = max_len
+        for seq in batch:
+            seq.cache = None
+
+    def _accept_token(self, seq: _Sequence, logits: torch.Tensor):
+        token = _sample(logits, seq.params)
+        seq.generated.append(token)
+        seq.next_token = token
+
+        if token in self.eos_token_ids or len(seq.generated) >= seq.params.max_new_tokens:
+            seq.finished = True
+
+
+def _sample(logits: torch.Tensor, params: GenerationParams) -> int:
+    """
+    Pick the next token for one sequence using its own sampling parameters.
+    """
+    if not params.do_sample or params.temperature <= 0:
+        return int(torch.argmax(logits))
+
+    # Same order as the transformers logits processors: temperature, top-k, top-p
+    logits = logits.float() / params.temperature
+
+    if params.top_k and params.top_k < logits.shape[-1]:
+        kth_largest = torch.topk(logits, params.top_k).values[-1]
+        logits = logits.masked_fill(logits < kth_largest, float("-inf"))
+
+    probs = torch.softmax(logits, dim=-1)
+
+    if params.top_p < 1.0:
+        sorted_probs, sorted_idx = torch.sort(probs, descending=True)
+        cumulative = torch.cumsum(sorted_probs, dim=-1)
+        sorted_probs[cumulative - sorted_probs > params.top_p] = 0.0
+        probs = torch.zeros_like(probs).scatter_(0, sorted_idx, sorted_probs)
+
+    return int(torch.multinomial(probs, 1))
+
+
+def _cache_to_layers(cache) -> List[tuple]:
+    """
+    Normalise a model cache to a list of per-layer (key, value) tensors.
+    """
+    if isinstance(cache, (tuple, list)):
+        return [(layer[0], layer[1]) for layer in cache]
+    if hasattr(cache, "layers"):
+        return [(layer.keys, layer.values) for layer in cache.layers]
+    return [(layer[0], layer[1]) for layer in cache.to_legacy_cache()]
+
+
+def _left_pad(tensor: torch.Tensor, length: int) -> torch.Tensor:
+    """
+    Left-pad a (1, heads, seq, head_dim) cache tensor along the sequence axis.
+    """
+    pad = length - tensor.shape[2]
+    if pad == 0:
+        return tensor
+    padding = tensor.new_zeros(
+        (tensor.shape[0], tensor.shape[1], pad, tensor.shape[3])
+    )
+    return torch.cat([padding, tensor], dim=2)
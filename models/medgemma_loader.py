@@ -1,14 +1,106 @@
+import asyncio
 import os
+import threading
+import time
 import torch
+from typing import Any, Callable, Dict, List, Optional
+from PIL import Image
 from transformers import AutoTokenizer, AutoProcessor, AutoModelForCausalLM, BitsAndBytesConfig
 
+# KV-cache strategies selectable from the loader config.
+# Each maps to the `cache_implementation` / `cache_config` pair that
+# `model.generate` picks up from the model's generation config.
+KV_CACHE_STRATEGIES = {
+    # Leaves the checkpoint's shipped cache settings in place (a cache that
+    # grows with the sequence; Gemma-3 checkpoints ship a hybrid cache)
+    "dynamic": {},
+    # Preallocated to prompt + max_new_tokens; fixed footprint, compile-friendly
+    "static": {"cache_implementation": "static"},
+    # Keys/values stored in low precision (requires optimum-quanto)
+    "quantized": {
+        "cache_implementation": "quantized",
+        "cache_config": {"backend": "quanto", "nbits": 4}
+    },
+    # Only the layer being computed is kept on the GPU; the rest live in CPU RAM
+    "offloaded": {"cache_implementation": "offloaded"},
+}
+
+# Dummy upstream results used to give warmup prompts the same shape as real ones
+_WARMUP_PATIENT = {
+    "age": 60,
+    "known_conditions": ["diabetes"],
+    "symptoms": ["blurred vision"]
+}
+_WARMUP_INTAKE = {
+    "input_valid": True,
+    "image_quality": "adequate",
+    "limitations": [],
+    "recommendation": "proceed"
+}
+_WARMUP_SCREENING = {
+    "observations": [{"feature": "microaneurysms", "location": "posterior pole", "confidence": "low"}],
+    "overall_assessment": "Few microvascular features.",
+    "uncertainty_notes": "Warmup sample."
+}
+_WARMUP_TRIAGE = {
+    "triage_level": "medium",
+    "reasoning": "Warmup sample.",
+    "recommended_action": "Refer for review"
+}
+
+
 class MedGemmaLoader:
     """
     Loader for MedGemma model using local Hugging Face cache.
+
+    Tracks a readiness `state` ("not_loaded", "loading", "loaded",
+    "warming_up", "ready", "failed") so front-ends can show progress while the model
+    loads and warms up.
     """
 
-    def __init__(self, model_id: str = "google/medgemma-1.5-4b-it"):
+    # Processors are memoized per model id across loader instances
+    _processor_cache: Dict[str, Any] = {}
+    _processor_lock = threading.Lock()
+
+    def __init__(
+        self,
+        model_id: str = "google/medgemma-1.5-4b-it",
+        kv_cache: Optional[str] = None,
+        kv_cache_config: Optional[Dict[str, Any]] = None
+    ):
+        """
+        Args:
+            model_id: Hugging Face model id
+            kv_cache: one of KV_CACHE_STRATEGIES; defaults to the
+                EYEAID_KV_CACHE environment variable, then "dynamic"
+            kv_cache_config: overrides for the strategy's cache_config
+                (e.g. {"nbits": 2} for the quantized cache)
+        """
         self.model_id = model_id
+        self.kv_cache = kv_cache or os.getenv("EYEAID_KV_CACHE", "dynamic")
+        self.kv_cache_config = kv_cache_config or {}
+
+        if self.kv_cache not in KV_CACHE_STRATEGIES:
+            raise ValueError(
+                f"Unknown KV cache strategy '{self.kv_cache}'. "
+                f"Choose from: {', '.join(KV_CACHE_STRATEGIES)}"
+            )
+
+        self.state = "not_loaded"
+        self.error: Optional[Exception] = None
+        self.model = None
+        self.processor = None
+        # AsyncInferenceEngine built by load_in_background(engine_factory=...)
+        self.engine = None
+        self.warmup_report: List[Dict[str, Any]] = []
+        # Cache settings the checkpoint shipped with, captured on first apply
+        self._shipped_cache_settings: Optional[Dict[str, Any]] = None
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def is_ready(self) -> bool:
+        return self.state == "ready"
     
     def load_model(self):
         """
@@ -18,6 +110,7 @@ class MedGemmaLoader:
             model, processor
         """
         print(f"Loading MedGemma model: {self.model_id}...")
+        self.state = "loading"
         
         # Quantization config for 4-bit loading
         bnb_config = BitsAndBytesConfig(
@@ -34,17 +127,292 @@ class MedGemmaLoader:
             # We will use AutoModelForCausalLM as it often auto-maps, but let's be safe with auto classes.
             # If it fails, we might need specific imports.
             
-            processor = AutoProcessor.from_pretrained(self.model_id)
+            processor = self._load_processor()
             model = AutoModelForCausalLM.from_pretrained(
                 self.model_id,
                 quantization_config=bnb_config,
                 device_map="auto",
                 trust_remote_code=True
             )
+
+            self.apply_kv_cache(model)
             
             print("Model loaded successfully.")
+            self.model, self.processor = model, processor
+            self.state = "loaded"
             return model, processor
 
         except Exception as e:
             print(f"Error loading model: {e}")
+            self.state = "failed"
+            self.error = e
             raise e
+
+    def _load_processor(self):
+        """
+        Load the processor once per model id and reuse it afterwards.
+        """
+        with self._processor_lock:
+            if self.model_id not in self._processor_cache:
+                self._processor_cache[self.model_id] = AutoProcessor.from_pretrained(self.model_id)
+            return self._processor_cache[self.model_id]
+
+    def warmup(
+        self,
+        model,
+        processor,
+        compile_graphs: bool = False,
+        max_new_tokens: Optional[int] = None,
+        engine=None
+    ) -> List[Dict[str, Any]]:
+        """
+        Run representative dummy prompts so the first real request sees
+        steady-state latency.
+
+        Readiness covers the path warmed here: `model.generate` by
+        default, or the AsyncInferenceEngine's prefill / batched decode
+        when `engine` is given. With an engine, every shape is also run
+        concurrently once so the batched-cache restack and multi-row decode
+        are exercised too.
+
+        Each agent's prompt is built from dummy upstream results and run
+        with that agent's sampling parameters and decode budget: the
+        screening prompt with an image, the text agents without. This
+        triggers kernel selection, processor/tokenizer lazy init and
+        allocator growth up front, and sizes a static KV cache for real
+        requests so they do not recompile.
+
+        Args:
+            model: model returned by load_model()
+            processor: processor returned by load_model()
+            compile_graphs: wrap the forward pass in torch.compile with a
+                static KV cache (skipped for the quantized and offloaded
+                strategies; falls back to eager if compilation fails)
+            max_new_tokens: override the agents' max_new_tokens (shorter
+                warmup, but compiled shapes will not match real requests)
+            engine: AsyncInferenceEngine serving this model, already
+                started with start_in_thread(); compilation is skipped
+                because its decode shapes change every step
+
+        Returns:
+            list of {"shape", "seconds"} timings, also kept on `warmup_report`
+        """
+        # Imported here to avoid a models -> agents import at module load
+        from agents.screening_agent import OphthalmicScreeningAgent
+        from agents.triage_agent import RiskAndTriageAgent
+        from agents.documentation_agent import ClinicalDocumentationAgent
+        from agents.patient_communication_agent import PatientCommunicationAgent
+
+        self.state = "warming_up"
+        print("Warming up MedGemma...")
+
+        if engine is not None and compile_graphs:
+            print("Skipping torch.compile: the inference engine's decode "
+                  "shapes change every step and would keep recompiling.")
+            compile_graphs = False
+
+        eager_forward = model.forward
+        compiled = compile_graphs and self._compile(model)
+
+        screening = OphthalmicScreeningAgent(model, processor)
+        triage = RiskAndTriageAgent(model, processor)
+        documentation = ClinicalDocumentationAgent(model, processor)
+        communication = PatientCommunicationAgent(model, processor)
+        dummy_image = Image.new("RGB", (896, 896), color=(120, 40, 20))
+
+        shapes = [
+            ("screening+image", screening.build_prompt(_WARMUP_PATIENT), dummy_image,
+             screening.GENERATION_KWARGS),
+            ("triage", triage.build_prompt(_WARMUP_PATIENT, _WARMUP_SCREENING), None,
+             triage.GENERATION_KWARGS),
+            ("documentation", documentation.build_prompt(
+                _WARMUP_PATIENT, _WARMUP_INTAKE, _WARMUP_SCREENING, _WARMUP_TRIAGE
+            ), None, documentation.GENERATION_KWARGS),
+            ("communication", communication.build_prompt(
+                _WARMUP_PATIENT, _WARMUP_SCREENING, _WARMUP_TRIAGE
+            ), None, communication.GENERATION_KWARGS),
+        ]
+
+        self.warmup_report = []
+        try:
+            for name, prompt, image, generation_kwargs in shapes:
+                kwargs = dict(generation_kwargs)
+                if max_new_tokens is not None:
+                    kwargs["max_new_tokens"] = max_new_tokens
+
+                if engine is not None:
+                    start = time.perf_counter()
+                    engine.run_sync(engine.generate(prompt, image=image, params=kwargs))
+                    self._record_warmup(name, time.perf_counter() - start)
+                    continue
+
+                if image is not None:
+                    inputs = processor(text=prompt, images=image, return_tensors="pt")
+                else:
+                    inputs = processor(text=prompt, return_tensors="pt")
+                inputs = inputs.to(model.device)
+
+                start = time.perf_counter()
+                try:
+                    self._generate(model, inputs, kwargs)
+                except Exception as e:
+                    if not compiled:
+                        raise
+                    # torch.compile fails lazily on the first call
+                    print(f"Compiled forward failed, continuing in eager mode: {e}")
+                    compiled = False
+                    model.forward = eager_forward
+                    self.apply_kv_cache(model)
+                    self._generate(model, inputs, kwargs)
+                self._record_warmup(name, time.perf_counter() - start)
+
+            if engine is not None:
+                start = time.perf_counter()
+                engine.run_sync(self._engine_batch(engine, shapes, max_new_tokens))
+                self._record_warmup("engine batch", time.perf_counter() - start)
+
+        except Exception as e:
+            print(f"Warmup failed: {e}")
+            self.state = "failed"
+            self.error = e
+            self._ready.set()
+            raise e
+
+        self.state = "ready"
+        self._ready.set()
+        return self.warmup_report
+
+    def _record_warmup(self, name: str, seconds: float):
+        self.warmup_report.append({"shape": name, "seconds": round(seconds, 3)})
+        print(f"  warmup {name}: {seconds:.2f}s")
+
+    async def _engine_batch(self, engine, shapes, max_new_tokens: Optional[int]):
+        """
+        Submit every warmup shape at once so they decode as one batch.
+        """
+        requests = []
+        for _, prompt, image, generation_kwargs in shapes:
+            kwargs = dict(generation_kwargs)
+            if max_new_tokens is not None:
+                kwargs["max_new_tokens"] = max_new_tokens
+            requests.append(engine.generate(prompt, image=image, params=kwargs))
+        await asyncio.gather(*requests)
+
+    def _generate(self, model, inputs, kwargs):
+        with torch.inference_mode():
+            model.generate(**inputs, **kwargs)
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+
+    def _compile(self, model) -> bool:
+        """
+        Compile the forward pass for static shapes; keep eager on failure.
+
+        Compilation needs a static KV cache, so it is only used when the
+        configured strategy is "dynamic" or "static"; other strategies are
+        kept and the model stays eager.
+        """
+        if self.kv_cache not in ("dynamic", "static"):
+            print(f"Skipping torch.compile: it needs a static KV cache, "
+                  f"keeping the '{self.kv_cache}' strategy.")
+            return False
+
+        eager_forward = model.forward
+        try:
+            model.generation_config.cache_implementation = "static"
+            model.forward = torch.compile(model.forward, mode="reduce-overhead", fullgraph=False)
+            print("Compiled forward pass with static KV cache.")
+            return True
+        except Exception as e:
+            print(f"torch.compile unavailable, continuing in eager mode: {e}")
+            model.forward = eager_forward
+            self.apply_kv_cache(model)
+            return False
+
+    def load_in_background(
+        self,
+        warmup: bool = True,
+        compile_graphs: bool = False,
+        engine_factory: Optional[Callable[[Any, Any], Any]] = None
+    ):
+        """
+        Load (and optionally warm up) the model on a daemon thread.
+        Poll `state` / `is_ready`, or block with `wait_until_ready()`.
+
+        Args:
+            engine_factory: called with (model, processor) after loading to
+                build a started AsyncInferenceEngine, kept on `engine`.
+                Warmup then runs through the engine, so readiness covers
+                the path the engine's callers use.
+        """
+        if self._thread is not None:
+            return
+
+        def _load():
+            try:
+                model, processor = self.load_model()
+                if engine_factory is not None:
+                    self.engine = engine_factory(model, processor)
+                if warmup:
+                    self.warmup(
+                        model, processor, compile_graphs=compile_graphs, engine=self.engine
+                    )
+                else:
+                    self.state = "ready"
+            except Exception as e:
+                self.state = "failed"
+                self.error = e
+            finally:
+                self._ready.set()
+
+        self._thread = threading.Thread(target=_load, name="eyeaid-model-load", daemon=True)
+        self._thread.start()
+
+    def wait_until_ready(self, timeout: Optional[float] = None):
+        """
+        Block until background loading finishes.
+
+        Returns:
+            model, processor
+        """
+        if not self._ready.wait(timeout):
+            raise TimeoutError(f"Model not ready after {timeout}s (state: {self.state})")
+        if self.state == "failed":
+            raise RuntimeError(f"Model failed to load: {self.error}")
+        return self.model, self.processor
+
+    def generation_kwargs(self) -> Dict[str, Any]:
+        """
+        Cache-related `model.generate` kwargs for the configured strategy.
+        """
+        kwargs = dict(KV_CACHE_STRATEGIES[self.kv_cache])
+        if "cache_config" in kwargs or self.kv_cache_config:
+            kwargs["cache_config"] = {
+                **kwargs.get("cache_config", {}),
+                **self.kv_cache_config
+            }
+        return kwargs
+
+    def apply_kv_cache(self, model):
+        """
+        Set the configured KV-cache strategy on the model's generation config,
+        so every agent's `model.generate` call uses it without extra kwargs.
+
+        The default strategy keeps the checkpoint's shipped settings; other
+        strategies are applied on top of them, so re-applying after a
+        temporary override (e.g. warmup compilation) restores the config.
+        """
+        generation_config = model.generation_config
+        if self._shipped_cache_settings is None:
+            self._shipped_cache_settings = {
+                "cache_implementation": getattr(generation_config, "cache_implementation", None),
+                "cache_config": getattr(generation_config, "cache_config", None),
+            }
+        for key, value in self._shipped_cache_settings.items():
+            setattr(generation_config, key, value)
+
+        for key, value in self.generation_kwargs().items():
+            setattr(generation_config, key, value)
+
+        print(f"KV cache strategy: {self.kv_cache}")
+        return model
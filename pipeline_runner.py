@@ -0,0 +1,388 @@
+import argparse
+import glob
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import nullcontext
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from agents.intake_agent import IntakeAndImageQualityAgent
+from agents.screening_agent import OphthalmicScreeningAgent
+from agents.triage_agent import RiskAndTriageAgent
+from agents.reporting_agent import ReportingAgent
+from models.admission_control import AdmissionController
+from models.medgemma_loader import MedGemmaLoader
+from utils.bulk_export import EXPORTERS
+
+# Marks the end of input on a stage queue
+_DONE = object()
+
+
+class StageStats:
+    """
+    Throughput and latency counters for one pipeline stage.
+    """
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.processed = 0
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+        self.service_times: List[float] = []
+        self._lock = threading.Lock()
+
+    def record(self, waits: List[float], service: float):
+        """
+        Record one handler call that processed len(waits) items together.
+        """
+        with self._lock:
+            self.processed += len(waits)
+            self.wait_seconds += sum(waits)
+            self.busy_seconds += service
+            self.service_times.extend([service] * len(waits))
+
+    def summary(self, wall_seconds: float) -> Dict[str, Any]:
+        times = sorted(self.service_times)
+        count = len(times)
+        return {
+            "workers": self.workers,
+            "processed": self.processed,
+            "throughput_per_min": round(60.0 * self.processed / wall_seconds, 2) if wall_seconds else 0.0,
+            "mean_latency_s": round(sum(times) / count, 3) if count else 0.0,
+            "p95_latency_s": round(times[min(count - 1, int(0.95 * count))], 3) if count else 0.0,
+            "mean_queue_wait_s": round(self.wait_seconds / count, 3) if count else 0.0,
+            "utilization": round(self.busy_seconds / (wall_seconds * self.workers), 2) if wall_seconds else 0.0
+        }
+
+
+class PipelineRunner:
+    """
+    Staged patient pipeline: intake -> screening -> triage -> reporting.
+
+    Each stage has its own worker threads and a bounded input queue, so
+    patient N+1's image QC and preprocessing run on the CPU while patient N
+    is decoding on the model. A full queue blocks the upstream stage
+    (back-pressure), which keeps preprocessed tensors from piling up.
+
+    Screening, triage and LLM reporting share one model, so they take
+    `model_lock` around every generation: only intake and preprocessing
+    run in parallel with decoding. Concurrent `generate` calls on one
+    model would otherwise share its static/compiled KV cache.
+
+    The screening stage drains every patient already queued for it and
+    runs them through `run_batch`, which picks batch sizes from free
+    memory; a larger `queue_size` allows larger screening batches.
+    """
+
+    STAGES = ["intake", "screening", "triage", "reporting"]
+
+    def __init__(
+        self,
+        model,
+        processor,
+        workers: Optional[Dict[str, int]] = None,
+        queue_size: int = 2,
+        reporting_mode: str = "auto"
+    ):
+        """
+        Args:
+            model: locally loaded MedGemma model
+            processor: matching processor
+            workers: worker threads per stage name (default 1 each)
+            queue_size: capacity of each inter-stage queue
+            reporting_mode: ReportingAgent mode ("llm", "auto" or "template")
+        """
+        self.workers = {stage: 1 for stage in self.STAGES}
+        self.workers.update(workers or {})
+        self.queue_size = queue_size
+
+        # Held for every model call; the model runs one generation at a time
+        self.model_lock = threading.Lock()
+
+        self.intake_agent = IntakeAndImageQualityAgent()
+        # Sizes screening batches from free memory. Model stages hold
+        # `model_lock`, so the batch it admits is the only generation running
+        self.admission = AdmissionController(model)
+        self.screening_agent = OphthalmicScreeningAgent(
+            model=model, processor=processor, admission=self.admission
+        )
+        self.triage_agent = RiskAndTriageAgent(model=model, processor=processor)
+        self.reporting_agent = ReportingAgent(model=model, processor=processor, mode=reporting_mode)
+
+        self.stats: Dict[str, StageStats] = {}
+        self.wall_seconds = 0.0
+        self.end_to_end_latencies: List[float] = []
+
+    def run(self, cases: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Process patients through the pipeline.
+
+        Args:
+            cases: list of {"patient_context": {...}, "image_path": "..."}
+
+        Returns:
+            one result per case, in input order, shaped like run_demo's output
+        """
+        queues = {
+            stage: queue.Queue(maxsize=self.queue_size) for stage in self.STAGES
+        }
+        self.stats = {
+            stage: StageStats(stage, self.workers[stage]) for stage in self.STAGES
+        }
+        self.end_to_end_latencies = []
+        results: List[Optional[Dict[str, Any]]] = [None] * len(cases)
+        results_lock = threading.Lock()
+        remaining = {stage: self.workers[stage] for stage in self.STAGES}
+        remaining_lock = threading.Lock()
+
+        # Every handler takes a list of items; only screening batches them
+        handlers = {
+            "intake": _per_item(self._intake),
+            "screening": self._screening,
+            "triage": _per_item(self._triage),
+            "reporting": _per_item(self._reporting),
+        }
+
+        def finish(item):
+            latency = time.perf_counter() - item["started_at"]
+            with results_lock:
+                results[item["index"]] = item["result"]
+                self.end_to_end_latencies.append(latency)
+
+        def worker(position):
+            stage = self.STAGES[position]
+            next_queue = queues[self.STAGES[position + 1]] if position + 1 < len(self.STAGES) else None
+
+            done = False
+            while not done:
+                item = queues[stage].get()
+                if item is _DONE:
+                    break
+
+                batch = [item]
+                if stage == "screening":
+                    # Take whatever else is already queued; run_batch sizes
+                    # the actual generate calls from free memory
+                    while len(batch) < self.admission.max_batch_size:
+                        try:
+                            extra = queues[stage].get_nowait()
+                        except queue.Empty:
+                            break
+                        if extra is _DONE:
+                            done = True
+                            break
+                        batch.append(extra)
+
+                dequeued = time.perf_counter()
+                try:
+                    handlers[stage](batch)
+                except Exception as e:
+                    for failed in batch:
+                        print(f"[pipeline] {stage} failed for case {failed['index']}: {e}")
+                        failed["result"] = {"status": "error", "stage": stage, "error": str(e)}
+                self.stats[stage].record(
+                    [dequeued - queued["enqueued_at"] for queued in batch],
+                    time.perf_counter() - dequeued
+                )
+
+                for item in batch:
+                    if "result" in item or next_queue is None:
+                        finish(item)
+                    else:
+                        item["enqueued_at"] = time.perf_counter()
+                        next_queue.put(item)
+
+            # The last worker out closes the next stage
+            with remaining_lock:
+                remaining[stage] -= 1
+                last = remaining[stage] == 0
+            if last and next_queue is not None:
+                for _ in range(self.workers[self.STAGES[position + 1]]):
+                    next_queue.put(_DONE)
+
+        def feed():
+            for index, case in enumerate(cases):
+                now = time.perf_counter()
+                queues["intake"].put({
+                    "index": index,
+                    "patient_context": case["patient_context"],
+                    "image_path": case["image_path"],
+                    "started_at": now,
+                    "enqueued_at": now
+                })
+            for _ in range(self.workers["intake"]):
+                queues["intake"].put(_DONE)
+
+        threads = [threading.Thread(target=feed, name="pipeline-feed")]
+        for position, stage in enumerate(self.STAGES):
+            for n in range(self.workers[stage]):
+                threads.append(
+                    threading.Thread(target=worker, args=(position,), name=f"pipeline-{stage}-{n}")
+                )
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.wall_seconds = time.perf_counter() - start
+
+        return results
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Per-stage throughput/latency and end-to-end stats of the last run.
+        """
+        latencies = sorted(self.end_to_end_latencies)
+        count = len(latencies)
+        return {
+            "patients": count,
+            "wall_seconds": round(self.wall_seconds, 2),
+            "patients_per_min": round(60.0 * count / self.wall_seconds, 2) if self.wall_seconds else 0.0,
+            "mean_end_to_end_s": round(sum(latencies) / count, 3) if count else 0.0,
+            "reporting": self.reporting_agent.stats(),
+            "stages": {
+                stage: stats.summary(self.wall_seconds) for stage, stats in self.stats.items()
+            }
+        }
+
+    # ---------------- Stage handlers ----------------
+
+    def _intake(self, item: Dict[str, Any]):
+        intake_results = self.intake_agent.run(
+            patient_context=item["patient_context"],
+            image_path=item["image_path"]
+        )
+        item["intake"] = intake_results
+
+        if not intake_results["input_valid"]:
+            item["result"] = {
+                "status": "stopped",
+                "stage": "intake",
+                "results": intake_results
+            }
+            return
+
+        # Decode and preprocess the image here, off the model's critical path
+        try:
+            item["screening_inputs"] = self.screening_agent.prepare_inputs(
+                item["patient_context"], item["image_path"]
+            )
+        except Exception as e:
+            # Screening will redo preprocessing and report the failure itself
+            print(f"[pipeline] screening preprocessing failed for case {item['index']}: {e}")
+            item["screening_inputs"] = None
+
+    def _screening(self, items: List[Dict[str, Any]]):
+        with self.model_lock:
+            results = self.screening_agent.run_batch(
+                patient_contexts=[item["patient_context"] for item in items],
+                image_paths=[item["image_path"] for item in items],
+                inputs=[item.pop("screening_inputs", None) for item in items]
+            )
+        for item, screening in zip(items, results):
+            item["screening"] = screening
+
+    def _triage(self, item: Dict[str, Any]):
+        with self.model_lock:
+            item["triage"] = self.triage_agent.run(
+                patient_context=item["patient_context"],
+                screening_results=item["screening"]
+            )
+
+    def _reporting(self, item: Dict[str, Any]):
+        # Template reports do not touch the model
+        uses_template = self.reporting_agent.uses_template(
+            item["intake"], item["screening"], item["triage"]
+        )
+        with nullcontext() if uses_template else self.model_lock:
+            reports = self.reporting_agent.run(
+                patient_context=item["patient_context"],
+                intake_results=item["intake"],
+                screening_results=item["screening"],
+                triage_results=item["triage"]
+            )
+        item["result"] = {
+            "status": "completed",
+            "intake": item["intake"],
+            "screening": item["screening"],
+            "triage": item["triage"],
+            **reports
+        }
+
+
+def _per_item(handler):
+    """
+    Adapt a single-item stage handler to the list-of-items interface.
+    """
+    def run(items: List[Dict[str, Any]]):
+        for item in items:
+            handler(item)
+    return run
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the staged screening pipeline")
+    parser.add_argument("--images", default="data/sample_images/*.jpg")
+    parser.add_argument("--queue-size", type=int, default=2)
+    parser.add_argument("--reporting-mode", choices=ReportingAgent.MODES, default="auto")
+    parser.add_argument(
+        "--export", nargs="*", default=[],
+        help="Bulk export paths; format from extension (.csv, .pdf, .hl7)"
+    )
+    for stage in PipelineRunner.STAGES:
+        parser.add_argument(f"--{stage}-workers", type=int, default=1)
+    args = parser.parse_args()
+
+    print("Initializing Local MedGemma Model...")
+    loader = MedGemmaLoader()
+    model, processor = loader.load_model()
+
+    patient_info = {
+        "age": 59,
+        "known_conditions": ["diabetes"],
+        "symptoms": ["blurred vision"],
+        "language_preference": "English"
+    }
+    cases = [
+        {"patient_context": patient_info, "image_path": path}
+        for path in sorted(glob.glob(args.images))
+    ]
+
+    runner = PipelineRunner(
+        model,
+        processor,
+        workers={stage: getattr(args, f"{stage}_workers") for stage in PipelineRunner.STAGES},
+        queue_size=args.queue_size,
+        reporting_mode=args.reporting_mode
+    )
+    outputs = runner.run(cases)
+
+    print("\n=== RESULTS ===")
+    for case, output in zip(cases, outputs):
+        print(f"{case['image_path']}: {output['status']}")
+
+    export_cases = [
+        {
+            "patient_id": os.path.splitext(os.path.basename(case["image_path"]))[0].rstrip("."),
+            "patient_context": case["patient_context"],
+            "result": output
+        }
+        for case, output in zip(cases, outputs)
+    ]
+    for path in args.export:
+        extension = os.path.splitext(path)[1].lstrip(".").lower()
+        if extension not in EXPORTERS:
+            print(f"Skipping export {path}: unsupported format '{extension}'")
+            continue
+        EXPORTERS[extension](export_cases, path)
+        print(f"Exported {len(export_cases)} results to {path}")
+
+    print("\n=== PIPELINE STATS ===")
+    print(json.dumps(runner.report(), indent=2))
@@ -0,0 +1,84 @@
+import json
+
+from utils.payload_serializer import PayloadSerializer
+
+PATIENT = {
+    "age": 59,
+    "known_conditions": ["diabetes"],
+    "symptoms": ["blurred vision"],
+    "language_preference": "English"
+}
+SCREENING = {
+    "observations": [
+        {"feature": "microaneurysms", "location": "inferotemporal arcade", "confidence": "moderate"},
+        {"feature": "hard exudates", "location": "near macula", "confidence": "low"}
+    ],
+    "overall_assessment": "Features consistent with non-proliferative changes.",
+    "uncertainty_notes": ""
+}
+
+
+def compact_line(text, label):
+    prefix = f"{label}: "
+    [line] = [line for line in text.splitlines() if line.startswith(prefix)]
+    return json.loads(line[len(prefix):])
+
+
+def test_verbose_mode_matches_json_dumps():
+    sections = [("Patient context", PATIENT), ("Screening findings", SCREENING)]
+    rendered = PayloadSerializer(compact=False).render(sections)
+    assert rendered == (
+        f"Patient context: {json.dumps(PATIENT)}\n"
+        f"Screening findings: {json.dumps(SCREENING)}"
+    )
+
+
+def test_observations_fold_into_rows():
+    rendered = PayloadSerializer().render([("Screening findings", SCREENING)])
+    payload = compact_line(rendered, "Screening findings")
+    assert payload["observations[feature|location|confidence]"] == [
+        "microaneurysms|inferotemporal arcade|moderate",
+        "hard exudates|near macula|low",
+    ]
+    assert payload["assessment"] == SCREENING["overall_assessment"]
+    assert "uncertainty" not in payload
+
+
+def test_pipe_in_cells_is_escaped():
+    screening = {
+        "observations": [
+            {"feature": "exudates | haemorrhages", "location": "macula", "confidence": "low"},
+            {"feature": "drusen", "location": "periphery", "confidence": "low"}
+        ]
+    }
+    payload = compact_line(PayloadSerializer().render([("Screening", screening)]), "Screening")
+    rows = payload["observations[feature|location|confidence]"]
+    assert rows[0] == "exudates / haemorrhages|macula|low"
+    assert all(row.count("|") == 2 for row in rows)
+
+
+def test_repeated_long_text_references_section_label():
+    triage = {"triage_level": "medium", "reasoning": SCREENING["overall_assessment"]}
+    rendered = PayloadSerializer().render([
+        ("Screening findings", SCREENING),
+        ("Triage decision", triage)
+    ])
+    payload = compact_line(rendered, "Triage decision")
+    assert payload["reasoning"] == "(same as Screening findings.assessment)"
+    # Short strings are never replaced
+    assert payload["level"] == "medium"
+
+
+def test_meaningful_empty_fields_are_kept():
+    patient = {"age": 40, "known_conditions": [], "symptoms": [], "language_preference": ""}
+    screening = {"observations": [], "overall_assessment": "Normal.", "uncertainty_notes": ""}
+    rendered = PayloadSerializer().render([
+        ("Patient context", patient),
+        ("Screening findings", screening)
+    ])
+    assert compact_line(rendered, "Patient context") == {
+        "age": 40, "conditions": [], "symptoms": []
+    }
+    assert compact_line(rendered, "Screening findings") == {
+        "observations": [], "assessment": "Normal."
+    }
@@ -0,0 +1,87 @@
+from utils.report_templates import is_routine, render_patient_explanation
+
+ADEQUATE_INTAKE = {
+    "input_valid": True,
+    "image_quality": "adequate",
+    "limitations": [],
+    "recommendation": "proceed"
+}
+LOW_TRIAGE = {
+    "triage_level": "low",
+    "reasoning": "No findings.",
+    "recommended_action": "Routine annual screening"
+}
+
+
+def screening(features, assessment="No abnormal findings.", uncertainty=""):
+    return {
+        "observations": [
+            {"feature": feature, "location": "posterior pole", "confidence": "high"}
+            for feature in features
+        ],
+        "overall_assessment": assessment,
+        "uncertainty_notes": uncertainty
+    }
+
+
+def test_routine_when_no_findings():
+    assert is_routine(ADEQUATE_INTAKE, screening([]), LOW_TRIAGE)
+
+
+def test_routine_with_whole_normal_phrases():
+    results = screening(["Normal", "no abnormal findings detected", "Unremarkable fundus."])
+    assert is_routine(ADEQUATE_INTAKE, results, LOW_TRIAGE)
+
+
+def test_qualified_normal_feature_is_a_finding():
+    results = screening(["normal-appearing disc with cupping"])
+    assert not is_routine(ADEQUATE_INTAKE, results, LOW_TRIAGE)
+
+
+def test_abnormal_feature_is_a_finding():
+    assert not is_routine(ADEQUATE_INTAKE, screening(["abnormal vessel calibre"]), LOW_TRIAGE)
+
+
+def test_finding_mentioning_normal_structure():
+    results = screening(["microaneurysms near normal disc"])
+    assert not is_routine(ADEQUATE_INTAKE, results, LOW_TRIAGE)
+
+
+def test_assessment_with_concern_is_not_routine():
+    results = screening([], assessment="Possible early non-proliferative changes.")
+    assert not is_routine(ADEQUATE_INTAKE, results, LOW_TRIAGE)
+
+
+def test_uncertainty_notes_are_not_routine():
+    results = screening([], uncertainty="Peripheral retina not fully visible.")
+    assert not is_routine(ADEQUATE_INTAKE, results, LOW_TRIAGE)
+
+
+def test_screening_failure_is_not_routine():
+    results = {
+        "observations": [],
+        "overall_assessment": "Screening failed due to local inference error.",
+        "uncertainty_notes": "CUDA out of memory"
+    }
+    assert not is_routine(ADEQUATE_INTAKE, results, LOW_TRIAGE)
+
+
+def test_marginal_image_is_not_routine():
+    intake = dict(ADEQUATE_INTAKE, image_quality="marginal")
+    assert not is_routine(intake, screening([]), LOW_TRIAGE)
+
+
+def test_invalid_input_is_not_routine():
+    intake = dict(ADEQUATE_INTAKE, input_valid=False)
+    assert not is_routine(intake, screening([]), LOW_TRIAGE)
+
+
+def test_non_low_triage_is_not_routine():
+    triage = dict(LOW_TRIAGE, triage_level="Medium")
+    assert not is_routine(ADEQUATE_INTAKE, screening([]), triage)
+
+
+def test_patient_explanation_does_not_reassure_on_qualified_finding():
+    results = screening(["normal-appearing disc with cupping"])
+    text = render_patient_explanation({"known_conditions": []}, results, LOW_TRIAGE)
+    assert "did not show any signs" not in text
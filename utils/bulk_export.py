@@ -0,0 +1,183 @@
+import csv
+import textwrap
+from datetime import datetime
+from typing import Any, Dict, List
+
+EXPORT_FIELDS = [
+    "patient_id",
+    "age",
+    "known_conditions",
+    "status",
+    "image_quality",
+    "findings",
+    "triage_level",
+    "recommended_action",
+    "report_source",
+    "clinical_documentation",
+    "patient_communication",
+]
+
+
+def export_rows(cases: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Flatten workflow results into one row per patient.
+
+    Args:
+        cases: list of {"patient_id", "patient_context", "result"} where
+            "result" is shaped like run_demo / PipelineRunner output
+    """
+    rows = []
+    for case in cases:
+        context = case.get("patient_context", {})
+        result = case.get("result") or {}
+        intake = result.get("intake") or result.get("results") or {}
+        screening = result.get("screening") or {}
+        triage = result.get("triage") or {}
+
+        findings = "; ".join(
+            str(obs.get("feature", "")) if isinstance(obs, dict) else str(obs)
+            for obs in screening.get("observations") or []
+        )
+
+        rows.append({
+            "patient_id": case.get("patient_id", ""),
+            "age": context.get("age", ""),
+            "known_conditions": ", ".join(context.get("known_conditions") or []),
+            "status": result.get("status", ""),
+            "image_quality": intake.get("image_quality", ""),
+            "findings": findings,
+            "triage_level": triage.get("triage_level", ""),
+            "recommended_action": triage.get("recommended_action", ""),
+            "report_source": result.get("report_source", ""),
+            "clinical_documentation": result.get("clinical_documentation", ""),
+            "patient_communication": result.get("patient_communication", ""),
+        })
+    return rows
+
+
+def export_csv(cases: List[Dict[str, Any]], path: str) -> str:
+    """
+    Write one CSV row per patient
+    """
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=EXPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(export_rows(cases))
+    return path
+
+
+def export_hl7(cases: List[Dict[str, Any]], path: str) -> str:
+    """
+    Write HL7 v2-style ORU^R01 text messages, one per patient.
+
+    This is a plain-text interchange layout (MSH/PID/OBR/OBX segments),
+    not a validated HL7 implementation.
+    """
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    messages = []
+
+    for index, row in enumerate(export_rows(cases), start=1):
+        segments = [
+            f"MSH|^~\\&|EYEAID|SCREENING_CAMP|||{timestamp}||ORU^R01|EYEAID{index:05d}|P|2.5",
+            f"PID|1||{_hl7(row['patient_id'])}",
+            f"OBR|1|||EYE_SCREEN^Ophthalmic screening|||{timestamp}",
+        ]
+        observations = [
+            ("AGE", "Age", row["age"]),
+            ("STATUS", "Workflow status", row["status"]),
+            ("IMGQ", "Image quality", row["image_quality"]),
+            ("FINDINGS", "Screening findings", row["findings"]),
+            ("TRIAGE", "Triage level", row["triage_level"]),
+            ("ACTION", "Recommended action", row["recommended_action"]),
+            ("NOTE", "Clinical documentation", row["clinical_documentation"]),
+        ]
+        for set_id, (code, label, value) in enumerate(observations, start=1):
+            segments.append(f"OBX|{set_id}|TX|{code}^{label}||{_hl7(value)}||||||F")
+        messages.append("\r".join(segments))
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\r\n".join(messages) + "\r\n")
+    return path
+
+
+def export_pdf(cases: List[Dict[str, Any]], path: str) -> str:
+    """
+    Write a plain-text PDF report with one section per patient.
+
+    Uses a minimal built-in PDF writer so no extra dependency is needed.
+    """
+    lines = [f"EyeAid Screening Camp Report - {datetime.now().strftime('%Y-%m-%d %H:%M')}", ""]
+    for row in export_rows(cases):
+        lines.append(f"Patient {row['patient_id']} | age {row['age']} | status {row['status']}")
+        lines.append(f"Triage: {row['triage_level']} - {row['recommended_action']}")
+        for block in (row["clinical_documentation"], row["patient_communication"]):
+            for paragraph in str(block).splitlines():
+                lines.extend(textwrap.wrap(paragraph, 95) or [""])
+        lines.append("-" * 95)
+
+    _write_text_pdf(lines, path)
+    return path
+
+
+EXPORTERS = {
+    "csv": export_csv,
+    "hl7": export_hl7,
+    "pdf": export_pdf,
+}
+
+
+def _hl7(value: Any) -> str:
+    """
+    Escape HL7 delimiters and flatten newlines
+    """
+    text = str(value)
+    for char, escape in (("\\", "\\E\\"), ("|", "\\F\\"), ("^", "\\S\\"), ("&", "\\T\\"), ("~", "\\R\\")):
+        text = text.replace(char, escape)
+    return text.replace("\r", " ").replace("\n", "\\.br\\")
+
+
+def _write_text_pdf(lines: List[str], path: str, lines_per_page: int = 60):
+    """
+    Minimal single-font PDF writer (Courier, Letter size)
+    """
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once page object ids are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier /Encoding /WinAnsiEncoding >>",
+    ]
+    page_ids = []
+    for page_lines in pages:
+        text = ["BT", "/F1 9 Tf", "11 TL", "40 752 Td"]
+        for line in page_lines:
+            escaped = line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            text.append(f"({escaped}) '")
+        text.append("ET")
+        stream = "\n".join(text).encode("cp1252", errors="replace")
+
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        output += b"%010d 00000 n \n" % offset
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+
+    with open(path, "wb") as f:
+        f.write(output)
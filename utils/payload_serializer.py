@@ -0,0 +1,190 @@
+import json
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# Shorter names for the fields agents pass to each other. They stay
+# self-explanatory so the prompt needs no legend to decode them.
+SHORT_KEYS = {
+    # Patient context
+    "known_conditions": "conditions",
+    "language_preference": "language",
+    # Intake
+    "input_valid": "valid",
+    "image_quality": "quality",
+    # Screening
+    "overall_assessment": "assessment",
+    "uncertainty_notes": "uncertainty",
+    # Triage
+    "triage_level": "level",
+    "recommended_action": "action",
+}
+
+# Repeated strings shorter than this cost fewer tokens than a reference
+MIN_DEDUP_CHARS = 32
+
+# Fields kept even when empty, because "nothing found" / "none reported"
+# is itself clinically meaningful
+KEEP_EMPTY_KEYS = {"observations", "limitations", "symptoms", "known_conditions"}
+
+
+class PayloadSerializer:
+    """
+    Serializes inter-agent payloads (intake, screening, triage dicts) into
+    prompt text.
+
+    Compact mode shortens keys, drops empty fields (except those in
+    KEEP_EMPTY_KEYS, such as screening observations), uses tight JSON
+    separators, folds lists of same-shaped records (e.g. screening
+    observations) into one header plus "a|b|c" rows, and replaces long
+    strings already emitted earlier with a reference naming the section
+    label and field, e.g. "(same as Screening findings.assessment)". Verbose mode
+    reproduces the original `json.dumps` prompt lines exactly.
+    """
+
+    def __init__(
+        self,
+        compact: bool = True,
+        short_keys: Optional[Dict[str, str]] = None,
+        min_dedup_chars: int = MIN_DEDUP_CHARS,
+        keep_empty_keys: Optional[Set[str]] = None
+    ):
+        """
+        Args:
+            compact: use the token-efficient encoding
+            short_keys: key -> short key map (defaults to SHORT_KEYS)
+            min_dedup_chars: minimum string length eligible for deduplication
+            keep_empty_keys: keys emitted even when empty (defaults to KEEP_EMPTY_KEYS)
+        """
+        self.compact = compact
+        self.short_keys = short_keys if short_keys is not None else SHORT_KEYS
+        self.min_dedup_chars = min_dedup_chars
+        self.keep_empty_keys = keep_empty_keys if keep_empty_keys is not None else KEEP_EMPTY_KEYS
+
+    def render(self, sections: List[Tuple[str, Dict[str, Any]]]) -> str:
+        """
+        Render labelled payloads as prompt lines.
+
+        Args:
+            sections: (label, payload) pairs in prompt order
+
+        Returns:
+            newline-joined "label: payload" lines
+        """
+        if not self.compact:
+            return "\n".join(
+                f"{label}: {json.dumps(payload)}" for label, payload in sections
+            )
+
+        seen: Dict[str, str] = {}
+        lines = []
+
+        for label, payload in sections:
+            compacted = self._compact(payload, label, seen)
+            lines.append(
+                f"{label}: {json.dumps(compacted, separators=(',', ':'))}"
+            )
+
+        return "\n".join(lines)
+
+    def _compact(
+        self,
+        value: Any,
+        path: str,
+        seen: Dict[str, str]
+    ) -> Any:
+        """
+        Recursively compact one value.
+
+        Args:
+            path: readable location of `value` ("Section label.key"), used
+                in references to it from later repeats
+            seen: long strings already emitted -> their path
+        """
+        if isinstance(value, dict):
+            result = {}
+            for key, item in value.items():
+                keep_empty = key in self.keep_empty_keys
+                if _is_empty(item) and not keep_empty:
+                    continue
+                short = self.short_keys.get(key, key)
+                records = self._as_rows(item)
+                if records is not None:
+                    columns, rows = records
+                    result[f"{short}[{'|'.join(columns)}]"] = rows
+                    continue
+                compacted = self._compact(item, f"{path}.{short}", seen)
+                if _is_empty(compacted) and not keep_empty:
+                    continue
+                result[short] = compacted
+            return result
+
+        if isinstance(value, list):
+            result = []
+            for position, item in enumerate(value):
+                if _is_empty(item):
+                    continue
+                result.append(self._compact(item, f"{path}[{position}]", seen))
+            return result
+
+        if isinstance(value, str):
+            text = value.strip()
+            if len(text) >= self.min_dedup_chars:
+                if text in seen:
+                    return f"(same as {seen[text]})"
+                seen[text] = path
+            return text
+
+        return value
+
+    def _as_rows(self, value: Any) -> Optional[Tuple[List[str], List[str]]]:
+        """
+        Fold a list of flat, same-keyed dicts into (columns, "a|b|c" rows).
+        Returns None when the list does not have that shape.
+        """
+        if not isinstance(value, list) or len(value) < 2:
+            return None
+        if not all(isinstance(item, dict) for item in value):
+            return None
+
+        columns = list(value[0].keys())
+        rows = []
+        for item in value:
+            if list(item.keys()) != columns:
+                return None
+            cells = []
+            for cell in item.values():
+                if isinstance(cell, (dict, list)):
+                    return None
+                cells.append("" if cell is None else str(cell).strip().replace("|", "/"))
+            rows.append("|".join(cells))
+
+        return [self.short_keys.get(column, column) for column in columns], rows
+
+
+def token_savings(
+    tokenizer,
+    verbose_prompt: str,
+    compact_prompt: str
+) -> Dict[str, Any]:
+    """
+    Compare token counts of the same prompt in verbose and compact form.
+    """
+    verbose_tokens = len(tokenizer(verbose_prompt)["input_ids"])
+    compact_tokens = len(tokenizer(compact_prompt)["input_ids"])
+    saved = verbose_tokens - compact_tokens
+
+    return {
+        "verbose_tokens": verbose_tokens,
+        "compact_tokens": compact_tokens,
+        "tokens_saved": saved,
+        "percent_saved": round(100.0 * saved / verbose_tokens, 1) if verbose_tokens else 0.0
+    }
+
+
+def _is_empty(value: Any) -> bool:
+    if value is None:
+        return True
+    if isinstance(value, (str, list, dict)) and len(value) == 0:
+        return True
+    if isinstance(value, str) and not value.strip():
+        return True
+    return False
@@ -0,0 +1,187 @@
+import re
+from typing import Any, Dict, List
+
+# Whole descriptions that mean "nothing found" rather than a finding.
+# Matched against the entire (normalised) text, so qualified wording such
+# as "normal-appearing disc with cupping" or "normal disc, mild cupping"
+# is treated as a finding and goes to the LLM.
+NORMAL_TEXT_PATTERN = re.compile(
+    r"(none|nil|normal|unremarkable|within normal limits"
+    r"|no (abnormal|significant|notable|visible|obvious) (findings?|features?|abnormalit(y|ies))"
+    r"( (detected|identified|seen|observed|noted))?"
+    r"|no abnormalit(y|ies)( (detected|identified|seen|observed|noted))?"
+    r"|(normal|unremarkable) (fundus|retina|appearance|examination|study))"
+)
+
+# Assessment text produced by the screening agent's own fallbacks
+SCREENING_FAILURE_TERMS = (
+    "screening failed",
+    "could not parse",
+)
+
+
+def is_routine(
+    intake_results: Dict[str, Any],
+    screening_results: Dict[str, Any],
+    triage_results: Dict[str, Any]
+) -> bool:
+    """
+    True for "adequate image, no findings, low triage" outcomes, whose
+    reports can be rendered from a template instead of generated.
+    """
+    if not intake_results.get("input_valid") or intake_results.get("image_quality") != "adequate":
+        return False
+
+    if str(triage_results.get("triage_level", "")).strip().lower() != "low":
+        return False
+
+    assessment = _normalise(screening_results.get("overall_assessment"))
+    if any(term in assessment for term in SCREENING_FAILURE_TERMS):
+        return False
+
+    # Free-text assessment and uncertainty must also say "nothing found";
+    # anything else (a concern, a caveat, limited visibility) needs the LLM
+    for field in ("overall_assessment", "uncertainty_notes"):
+        if not _is_normal_text(screening_results.get(field)):
+            return False
+
+    return len(_findings(screening_results)) == 0
+
+
+def render_clinical_note(
+    patient_context: Dict[str, Any],
+    intake_results: Dict[str, Any],
+    screening_results: Dict[str, Any],
+    triage_results: Dict[str, Any]
+) -> str:
+    """
+    Deterministic clinical note in the Documentation Agent's output format
+    """
+    findings = _findings(screening_results)
+    if findings:
+        observations = "; ".join(_describe_observation(obs) for obs in findings) + "."
+    else:
+        observations = "No notable retinal features identified at screening level."
+
+    assessment = str(screening_results.get("overall_assessment", "")).strip()
+    if assessment:
+        observations += f" {assessment}"
+
+    limitations = intake_results.get("limitations") or []
+    image_quality = str(intake_results.get("image_quality", "unknown")).capitalize()
+    if limitations:
+        image_quality += f"; limitations: {', '.join(limitations)}."
+    else:
+        image_quality += "; no quality limitations identified."
+
+    level = str(triage_results.get("triage_level", "unknown")).upper()
+    action = triage_results.get("recommended_action") or "Routine follow-up screening as scheduled."
+
+    return (
+        "Screening Summary:\n"
+        f"- Patient Summary: {_patient_summary(patient_context)}\n"
+        f"- Image Quality: {image_quality}\n"
+        f"- Screening Observations: {observations}\n"
+        f"- Triage Recommendation: {level} - {action}"
+    )
+
+
+def render_patient_explanation(
+    patient_context: Dict[str, Any],
+    screening_results: Dict[str, Any],
+    triage_results: Dict[str, Any]
+) -> str:
+    """
+    Deterministic patient explanation in the Communication Agent's output format
+    """
+    level = str(triage_results.get("triage_level", "")).strip().lower()
+    action = triage_results.get("recommended_action")
+
+    if not _findings(screening_results) and level == "low":
+        findings_text = (
+            "Today's photograph of the back of your eye was clear, and the screening "
+            "did not show any signs that need further attention right now."
+        )
+    else:
+        findings_text = (
+            "Today's photograph of the back of your eye showed some features that "
+            "an eye specialist should look at more closely. This screening does not "
+            "give a diagnosis, and many of these changes can be managed well when "
+            "they are checked early."
+        )
+
+    if level == "low":
+        next_steps = "Please continue your regular eye check-ups."
+    elif level == "medium":
+        next_steps = "We recommend an appointment with an eye specialist in the coming weeks."
+    else:
+        next_steps = "We recommend seeing an eye specialist as soon as possible."
+    if action:
+        action = str(action).strip()
+        next_steps += f" Recommended next step: {action}"
+        if not action.endswith((".", "!", "?")):
+            next_steps += "."
+
+    conditions = [str(c).lower() for c in patient_context.get("known_conditions", [])]
+    if "diabetes" in conditions:
+        next_steps += (
+            " Because diabetes can affect the eyes over time, yearly eye screening "
+            "and keeping your blood sugar under control are important."
+        )
+
+    return (
+        "Patient Explanation:\n"
+        f"{findings_text}\n\n"
+        f"{next_steps}\n\n"
+        "If you notice sudden changes in your vision, eye pain, or new floaters, "
+        "please contact a healthcare provider promptly."
+    )
+
+
+def _findings(screening_results: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Screening observations that describe an actual finding
+    """
+    findings = []
+    for obs in screening_results.get("observations") or []:
+        feature = obs.get("feature", "") if isinstance(obs, dict) else obs
+        if _is_normal_text(feature):
+            continue
+        findings.append(obs if isinstance(obs, dict) else {"feature": str(obs)})
+    return findings
+
+
+def _normalise(text: Any) -> str:
+    """
+    Lower-case, collapse whitespace and drop trailing punctuation
+    """
+    if text is None:
+        return ""
+    return " ".join(str(text).lower().split()).rstrip(".!;, ")
+
+
+def _is_normal_text(text: Any) -> bool:
+    """
+    True for empty text or text that as a whole means "nothing found"
+    """
+    normalised = _normalise(text)
+    return not normalised or NORMAL_TEXT_PATTERN.fullmatch(normalised) is not None
+
+
+def _describe_observation(obs: Dict[str, Any]) -> str:
+    text = str(obs.get("feature", "unspecified feature"))
+    if obs.get("location"):
+        text += f" ({obs['location']})"
+    if obs.get("confidence"):
+        text += f", {obs['confidence']} confidence"
+    return text
+
+
+def _patient_summary(patient_context: Dict[str, Any]) -> str:
+    age = patient_context.get("age")
+    conditions = ", ".join(patient_context.get("known_conditions") or []) or "none reported"
+    symptoms = ", ".join(
+        s.strip() for s in patient_context.get("symptoms") or [] if str(s).strip()
+    ) or "none reported"
+    subject = f"{age}-year-old patient" if age is not None else "Patient of unrecorded age"
+    return f"{subject}; known conditions: {conditions}; symptoms: {symptoms}."
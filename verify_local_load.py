@@ -1,4 +1,5 @@
 import os
+import time
 import torch
 from dotenv import load_dotenv
 from models.medgemma_loader import MedGemmaLoader
@@ -22,15 +23,22 @@ def verify():
         loader = MedGemmaLoader()
         model, processor = loader.load_model()
         print("Model loaded successfully!")
+
+        # Warm up each agent's prompt shape before the timed request
+        loader.warmup(model, processor)
         
         # Simple test
         prompt = "test"
         inputs = processor(text=prompt, return_tensors="pt").to(model.device)
         print("Input prepared. Running generation...")
         
+        start = time.perf_counter()
         out = model.generate(**inputs, max_new_tokens=10)
+        elapsed = time.perf_counter() - start
         res = processor.batch_decode(out, skip_special_tokens=True)[0]
         print(f"Test generation result: {res}")
+        print(f"First post-warmup generation: {elapsed:.2f}s "
+              f"(warmup: {sum(r['seconds'] for r in loader.warmup_report):.2f}s)")
         print("Verification PASSED.")
         
     except Exception as e: